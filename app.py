@@ -8,29 +8,16 @@ st.set_page_config(
 )
 
 # Standard library imports
-import datetime
-import re
-import random
 import os
-import time
 import sqlite3
-import json
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from io import BytesIO
-from typing import Optional, Tuple, Dict, Any
 
 # Third-party imports
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
-import qrcode
-from PIL import Image
-import base64
-import requests # For KoBo API calls
-import paypalrestsdk # For PayPal integration
-from paypalrestsdk import Payment
+import pydeck as pdk
 
 # Custom module imports
 try:
@@ -98,216 +85,12 @@ except ImportError as e:
 
 
 # --- Custom CSS for Styling ---
-def load_css():
-    st.markdown("""
-    <style>
-        /* Global Resets & Base Styles */
-        html, body {
-            margin: 0;
-            padding: 0;
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji";
-            background-color: #f0f2f5; /* Lighter, cleaner background */
-            color: #333;
-            line-height: 1.6;
-        }
-
-        /* Main App Container - More Compact */
-        .main .block-container {
-            padding-top: 1.5rem; /* Reduced top padding */
-            padding-bottom: 1.5rem;
-            padding-left: 1rem;
-            padding-right: 1rem;
-            max-width: 1200px; /* Constrain width for better readability on large screens */
-            margin: 0 auto;
-        }
-
-        /* Header Styling - Modern & Clean */
-        .header-text {
-            color: #1D7749; /* Deeper, more sophisticated green */
-            font-weight: 700;
-            font-size: 2.2rem; /* Slightly reduced for compactness */
-            margin-bottom: 1rem; /* Consistent spacing */
-            text-align: left;
-        }
-
-        /* Sidebar Styling - Clean & Functional */
-        .sidebar .sidebar-content {
-            background-color: #ffffff; /* White sidebar for cleaner look */
-            border-right: 1px solid #e0e0e0;
-            padding: 1rem;
-        }
-        .sidebar .sidebar-content h3 {
-            color: #1D7749;
-            font-size: 1.1rem;
-            margin-top: 0;
-        }
-        .sidebar .sidebar-content p {
-            font-size: 0.9rem;
-            color: #555;
-        }
-        .sidebar .stRadio > label {
-            font-weight: 600;
-            font-size: 1rem;
-            color: #333;
-        }
-        .sidebar .stRadio div[role="radiogroup"] > div {
-            margin-bottom: 0.5rem;
-        }
-
-        /* Button Styling - Modern & Action-Oriented */
-        .stButton>button {
-            background-color: #28a745; /* Vibrant green */
-            color: white;
-            border-radius: 6px; /* Slightly less rounded */
-            padding: 0.6rem 1.2rem; /* Adjusted padding */
-            border: none;
-            font-weight: 600;
-            transition: all 0.2s ease-in-out;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-        .stButton>button:hover {
-            background-color: #218838; /* Darker on hover */
-            transform: translateY(-1px);
-            box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-        }
-        .stButton>button:active {
-            transform: translateY(0px);
-            box_shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-
-        /* Card Styling - Elevated & Informative */
-        .card {
-            background-color: white;
-            border-radius: 8px; /* Consistent rounding */
-            padding: 1.2rem; /* Adjusted padding */
-            box-shadow: 0 3px 6px rgba(0,0,0,0.08); /* Softer shadow */
-            margin-bottom: 1.2rem;
-            border: 1px solid #e0e0e0;
-        }
-        .card h3 {
-            color: #1D7749;
-            margin-top: 0;
-            margin-bottom: 0.5rem;
-            font-size: 1.3rem;
-        }
-        .card p {
-            font-size: 0.95rem;
-            color: #444;
-            margin-bottom: 0.8rem;
-        }
-
-        /* Metric Card Styling - Impactful & Clear */
-        .metric-card {
-            background-color: #ffffff;
-            border-radius: 8px;
-            padding: 1rem;
-            box-shadow: 0 3px 6px rgba(0,0,0,0.07);
-            margin-bottom: 1rem;
-            text-align: center;
-            border: 1px solid #e8e8e8;
-            transition: transform 0.2s ease, box-shadow 0.2s ease;
-        }
-        .metric-card:hover {
-            transform: translateY(-3px);
-            box-shadow: 0 5px 10px rgba(0,0,0,0.1);
-        }
-        .metric-value {
-            font-size: 2rem; /* Slightly reduced for compactness */
-            font-weight: 700;
-            color: #1D7749;
-            margin: 0.3rem 0;
-        }
-        .metric-label {
-            font-size: 0.85rem; /* Slightly reduced */
-            color: #555;
-            text-transform: uppercase;
-            letter-spacing: 0.5px;
-        }
-
-        /* Form Elements - Clean & User-Friendly */
-        .stTextInput input, .stDateInput input, .stNumberInput input, .stSelectbox div[data-baseweb="select"] > div {
-            border-radius: 6px !important;
-            border: 1px solid #ccc !important;
-        }
-        .stTextArea textarea {
-            border-radius: 6px !important;
-            border: 1px solid #ccc !important;
-            padding: 0.75rem !important;
-        }
-        .stForm {
-            border: 1px solid #e0e0e0;
-            border-radius: 8px;
-            padding: 1.5rem;
-            background-color: #f9f9f9;
-        }
-
-        /* Tabs Styling - Modern & Integrated */
-        .stTabs [data-baseweb="tab-list"] {
-            gap: 8px; /* Reduced gap */
-            border-bottom: 2px solid #e0e0e0;
-        }
-        .stTabs [data-baseweb="tab"] {
-            background-color: transparent; /* Cleaner look */
-            border-radius: 6px 6px 0 0 !important;
-            padding: 0.7rem 1.2rem; /* Adjusted padding */
-            color: #555;
-            font-weight: 600;
-            border: none !important; /* Remove default borders */
-            border-bottom: 2px solid transparent !important;
-            transition: all 0.2s ease-in-out;
-        }
-        .stTabs [aria-selected="true"] {
-            background-color: transparent !important;
-            color: #1D7749 !important;
-            border-bottom: 2px solid #1D7749 !important;
-        }
-
-        /* Footer Styling - Unobtrusive */
-        .footer {
-            margin-top: 2rem; /* Reduced margin */
-            padding: 1rem 0;
-            border-top: 1px solid #e0e0e0;
-            text-align: center;
-            font-size: 0.85rem;
-            color: #777;
-        }
+@st.cache_resource
+def read_app_css():
+    return (BASE_DIR / "static" / "app.css").read_text(encoding="utf-8")
 
-        /* Responsive Adjustments */
-        @media (max-width: 768px) {
-            .main .block-container {
-                padding-top: 1rem;
-                padding-left: 0.5rem;
-                padding-right: 0.5rem;
-            }
-            .header-text {
-                font-size: 1.8rem;
-            }
-            .metric-card {
-                padding: 0.8rem;
-                margin-bottom: 0.8rem;
-            }
-            .metric-value {
-                font-size: 1.6rem;
-            }
-            .metric-label {
-                font-size: 0.75rem;
-            }
-            .stButton>button {
-                padding: 0.5rem 1rem;
-                width: 100%; /* Full width buttons on mobile */
-            }
-            .stTabs [data-baseweb="tab"] {
-                padding: 0.6rem 1rem;
-            }
-            .card {
-                padding: 1rem;
-            }
-            .stForm {
-                padding: 1rem;
-            }
-        }
-    </style>
-    """, unsafe_allow_html=True)
+def load_css():
+    st.markdown(f"<style>{read_app_css()}</style>", unsafe_allow_html=True)
 
 # --- Configuration ---
 BASE_DIR = Path(__file__).parent if "__file__" in locals() else Path.cwd()
@@ -332,98 +115,191 @@ USER_ROLES = {
     "admin": "Administrator"
 }
 
+# --- Database Connection ---
+# One connection per server process, shared by every session, and the lock that serializes its use
+@st.cache_resource(show_spinner=False)
+def get_db_connection():
+    DATA_DIR.mkdir(exist_ok=True, parents=True)
+    conn = sqlite3.connect(SQLITE_DB, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    return conn, threading.Lock()
+
+@contextmanager
+def db_connection():
+    """Hold the shared connection for the duration of a with block"""
+    conn, lock = get_db_connection()
+    with lock:
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
 # --- Database Initialization (SQL parts for app data only) ---
+@st.cache_resource(show_spinner=False)
 def init_db():
-    DATA_DIR.mkdir(exist_ok=True, parents=True)
-    conn = sqlite3.connect(SQLITE_DB)
-    c = conn.cursor()
-    
-    # Create tables for app data (not users)
-    c.execute("""CREATE TABLE IF NOT EXISTS trees (
-        tree_id TEXT PRIMARY KEY, institution TEXT, local_name TEXT, scientific_name TEXT,
-        planter_id TEXT, date_planted TEXT, tree_stage TEXT, rcd_cm REAL, dbh_cm REAL,
-        height_m REAL, latitude REAL, longitude REAL, co2_kg REAL, status TEXT, country TEXT,
-        county TEXT, sub_county TEXT, ward TEXT, adopter_name TEXT, last_monitored TEXT,
-        monitor_notes TEXT, qr_code TEXT, kobo_submission_id TEXT UNIQUE,
-        tree_tracking_number TEXT
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS species (
-        scientific_name TEXT PRIMARY KEY, local_name TEXT, wood_density REAL, benefits TEXT
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS monitoring_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, tree_id TEXT, monitor_date TEXT, monitor_status TEXT,
-        monitor_stage TEXT, rcd_cm REAL, dbh_cm REAL, height_m REAL, co2_kg REAL, notes TEXT,
-        monitor_by TEXT, kobo_submission_id TEXT UNIQUE, FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS donations (
-        donation_id TEXT PRIMARY KEY, donor_email TEXT, donor_name TEXT, institution_id TEXT,
-        num_trees INTEGER, amount REAL, currency TEXT, donation_date TEXT, payment_id TEXT,
-        payment_status TEXT, message TEXT
-    )""")
-    
-    c.execute("""CREATE TABLE IF NOT EXISTS donated_trees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT, donation_id TEXT, tree_id TEXT,
-        FOREIGN KEY (donation_id) REFERENCES donations (donation_id),
-        FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
-    )""")
+    with db_connection() as conn:
+        c = conn.cursor()
+    
+        # Create tables for app data (not users)
+        c.execute("""CREATE TABLE IF NOT EXISTS trees (
+            tree_id TEXT PRIMARY KEY, institution TEXT, local_name TEXT, scientific_name TEXT,
+            planter_id TEXT, date_planted TEXT, tree_stage TEXT, rcd_cm REAL, dbh_cm REAL,
+            height_m REAL, latitude REAL, longitude REAL, co2_kg REAL, status TEXT, country TEXT,
+            county TEXT, sub_county TEXT, ward TEXT, adopter_name TEXT, last_monitored TEXT,
+            monitor_notes TEXT, qr_code TEXT, kobo_submission_id TEXT UNIQUE,
+            tree_tracking_number TEXT
+        )""")
+    
+        c.execute("""CREATE TABLE IF NOT EXISTS species (
+            scientific_name TEXT PRIMARY KEY, local_name TEXT, wood_density REAL, benefits TEXT
+        )""")
+    
+        c.execute("""CREATE TABLE IF NOT EXISTS monitoring_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, tree_id TEXT, monitor_date TEXT, monitor_status TEXT,
+            monitor_stage TEXT, rcd_cm REAL, dbh_cm REAL, height_m REAL, co2_kg REAL, notes TEXT,
+            monitor_by TEXT, kobo_submission_id TEXT UNIQUE, FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
+        )""")
+    
+        c.execute("""CREATE TABLE IF NOT EXISTS donations (
+            donation_id TEXT PRIMARY KEY, donor_email TEXT, donor_name TEXT, institution_id TEXT,
+            num_trees INTEGER, amount REAL, currency TEXT, donation_date TEXT, payment_id TEXT,
+            payment_status TEXT, message TEXT
+        )""")
+    
+        c.execute("""CREATE TABLE IF NOT EXISTS donated_trees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, donation_id TEXT, tree_id TEXT,
+            FOREIGN KEY (donation_id) REFERENCES donations (donation_id),
+            FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
+        )""")
         
-    c.execute("""CREATE TABLE IF NOT EXISTS processed_monitoring_submissions (
-        submission_id TEXT PRIMARY KEY, tree_id TEXT, processed_date TEXT,
-        FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
-    )""")
-
-    # Initialize species data if table is empty
-    if c.execute("SELECT COUNT(*) FROM species").fetchone()[0] == 0:
-        default_species = [
-            ("Acacia spp.", "Acacia", 0.65, "Drought-resistant, nitrogen-fixing, provides shade"),
-            ("Eucalyptus spp.", "Eucalyptus", 0.55, "Fast-growing, timber production, medicinal uses"),
-            ("Mangifera indica", "Mango", 0.50, "Fruit production, shade tree, ornamental"),
-            ("Azadirachta indica", "Neem", 0.60, "Medicinal properties, insect repellent, drought-resistant"),
-            ("Quercus spp.", "Oak", 0.75, "Long-term carbon storage, wildlife habitat, durable wood"),
-            ("Pinus spp.", "Pine", 0.45, "Reforestation, timber production, resin production")
-        ]
-        c.executemany("INSERT INTO species VALUES (?, ?, ?, ?)", default_species)
-
-    conn.commit()
-    conn.close()
+        c.execute("""CREATE TABLE IF NOT EXISTS processed_monitoring_submissions (
+            submission_id TEXT PRIMARY KEY, tree_id TEXT, processed_date TEXT,
+            FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
+        )""")
+
+        # Initialize species data if table is empty
+        if c.execute("SELECT COUNT(*) FROM species").fetchone()[0] == 0:
+            default_species = [
+                ("Acacia spp.", "Acacia", 0.65, "Drought-resistant, nitrogen-fixing, provides shade"),
+                ("Eucalyptus spp.", "Eucalyptus", 0.55, "Fast-growing, timber production, medicinal uses"),
+                ("Mangifera indica", "Mango", 0.50, "Fruit production, shade tree, ornamental"),
+                ("Azadirachta indica", "Neem", 0.60, "Medicinal properties, insect repellent, drought-resistant"),
+                ("Quercus spp.", "Oak", 0.75, "Long-term carbon storage, wildlife habitat, durable wood"),
+                ("Pinus spp.", "Pine", 0.45, "Reforestation, timber production, resin production")
+            ]
+            # The shared connection is in autocommit mode, so group the seed rows into one transaction
+            c.execute("BEGIN")
+            c.executemany("INSERT INTO species VALUES (?, ?, ?, ?)", default_species)
+            c.execute("COMMIT")
+
+        # Indexes for the per-tree and per-institution lookups. Databases migrated from older
+        # versions have no PRIMARY KEY on trees, so tree_id is indexed explicitly as well.
+        c.execute("CREATE INDEX IF NOT EXISTS idx_trees_tree_id ON trees(tree_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_trees_institution ON trees(institution)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_monitoring_history_tree ON monitoring_history(tree_id, monitor_date)")
+        c.execute("ANALYZE")
 
 # --- Data Loading (for app data) ---
-def load_tree_data():
-    conn = sqlite3.connect(SQLITE_DB)
-    try:        
-        df = pd.read_sql_query("SELECT * FROM trees", conn)
+# Only the columns the dashboards actually read; tree_tracking_number is optional in older databases
+TREE_SUMMARY_COLUMNS = ["tree_id", "institution", "status", "co2_kg", "tree_tracking_number"]
+TREE_SUMMARY_DTYPES = {
+    "tree_id": "string[pyarrow]",
+    "tree_tracking_number": "string[pyarrow]",
+    "institution": "category",
+    "status": "category",
+    "co2_kg": "float64"
+}
+
+# Chart and map colours
+STATUS_COLORS = {"Alive": [40, 167, 69], "Dead": [220, 53, 69]}
+DEFAULT_STATUS_COLOR = [128, 128, 128]
+INSTITUTION_CHART_SCALE = px.colors.sequential.Greens
+
+def get_db_version():
+    # Modification time of the SQLite file (and its WAL, when present); changes on every committed write
+    db_files = (SQLITE_DB, SQLITE_DB.with_name(SQLITE_DB.name + "-wal"))
+    return max((os.path.getmtime(path) for path in db_files if os.path.exists(path)), default=0.0)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_recent_tree_locations(version, limit=50):
+    # Map points for the landing page: the most recent trees with coordinates, coloured by status
+    try:
+        with db_connection() as conn:
+            rows = conn.execute(
+                """SELECT tree_id, local_name, institution, date_planted, status, latitude, longitude
+                FROM trees
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                ORDER BY date_planted DESC
+                LIMIT ?""",
+                (limit,)
+            ).fetchall()
+    except sqlite3.DatabaseError:
+        rows = []
+
+    return [
+        {
+            "tree_id": tree_id,
+            "local_name": local_name,
+            "institution": institution,
+            "date_planted": date_planted,
+            "latitude": latitude,
+            "longitude": longitude,
+            "color": STATUS_COLORS.get(status, DEFAULT_STATUS_COLOR)
+        }
+        for tree_id, local_name, institution, date_planted, status, latitude, longitude in rows
+    ]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_tree_data(version=None):
+    try:
+        with db_connection() as conn:
+            existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(trees)")}
+            columns = [col for col in TREE_SUMMARY_COLUMNS if col in existing_columns]
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(columns)} FROM trees",
+                conn,
+                dtype={col: dtype for col, dtype in TREE_SUMMARY_DTYPES.items() if col in columns}
+            )
     except pd.io.sql.DatabaseError: 
         df = pd.DataFrame()
-    conn.close()
     return df
 
 # --- Admin Dashboard Content ---
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_institution_chart(institution_stats):
+    fig_inst = px.bar(
+        institution_stats.sort_values("total_trees", ascending=False),
+        x="institution", y="total_trees", title="Trees Planted by Institution",
+        color="survival_rate", color_continuous_scale=INSTITUTION_CHART_SCALE
+    )
+    fig_inst.update_layout(title_x=0.5)
+    return fig_inst
+
 def admin_dashboard_content(): 
     st.markdown("<h1 class='header-text'>👑 Admin Dashboard</h1>", unsafe_allow_html=True)
     
     # Admin metrics
-    trees = load_tree_data()
+    trees = load_tree_data(get_db_version())
     
     st.markdown("<h4 style='color: #1D7749; margin-bottom: 0.5rem;'>System Overview</h4>", unsafe_allow_html=True)
     admin_metric_cols = st.columns(4)
     
     # Calculate metrics
     total_trees = len(trees)
-    alive_trees = len(trees[trees["status"] == "Alive"]) if "status" in trees.columns and not trees.empty else 0
+    alive_mask = trees["status"].eq("Alive") if "status" in trees.columns else pd.Series(False, index=trees.index)
+    alive_trees = int(alive_mask.sum())
     survival_rate = f"{round((alive_trees / total_trees) * 100, 1)}%" if total_trees > 0 else "0%"
     co2_sequestered = f"{round(trees['co2_kg'].sum(), 2)} kg" if "co2_kg" in trees.columns and not trees.empty else "0 kg"
-    
-    # MODIFIED: Changed 'institution_id' to 'institution' as per the column name in the 'trees' table
-    num_institutions = trees['institution'].nunique() if 'institution' in trees.columns and not trees.empty else 0
 
     admin_metrics = [
         (total_trees, "Total Trees"),
         (survival_rate, "Overall Survival"),
         (co2_sequestered, "Total CO₂"),
-        (len(set(trees["tree_tracking_number"])) if "tree_tracking_number" in trees.columns and not trees.empty else 0, "Active Users")
+        (trees["tree_tracking_number"].nunique(dropna=False) if "tree_tracking_number" in trees.columns else 0, "Active Users")
     ]
     
     for i, (value, label) in enumerate(admin_metrics):
@@ -438,22 +314,21 @@ def admin_dashboard_content():
         
         # MODIFIED: Changed 'institution_id' to 'institution'
         if not trees.empty and "institution" in trees.columns:
-            institution_stats = trees.groupby("institution").agg(
-                total_trees=pd.NamedAgg(column="tree_id", aggfunc="count"),
-                alive_trees=pd.NamedAgg(column="status", aggfunc=lambda x: (x == "Alive").sum()),
-                total_co2=pd.NamedAgg(column="co2_kg", aggfunc="sum")
-            ).reset_index()
+            institution_stats = (
+                trees.assign(alive=alive_mask)
+                .groupby("institution", observed=True)
+                .agg(
+                    total_trees=pd.NamedAgg(column="tree_id", aggfunc="count"),
+                    alive_trees=pd.NamedAgg(column="alive", aggfunc="sum"),
+                    total_co2=pd.NamedAgg(column="co2_kg", aggfunc="sum")
+                )
+                .reset_index()
+            )
             
             institution_stats["survival_rate"] = round((institution_stats["alive_trees"] / institution_stats["total_trees"]) * 100, 1).fillna(0)
             
             if not institution_stats.empty:
-                # MODIFIED: Changed 'institution_id' to 'institution'
-                fig_inst = px.bar(
-                    institution_stats.sort_values("total_trees", ascending=False),
-                    x="institution", y="total_trees", title="Trees Planted by Institution",
-                    color="survival_rate", color_continuous_scale=px.colors.sequential.Greens
-                )
-                fig_inst.update_layout(title_x=0.5)
+                fig_inst = build_institution_chart(institution_stats)
                 st.plotly_chart(fig_inst, use_container_width=True)
                 st.dataframe(institution_stats, use_container_width=True)
             else:
@@ -512,10 +387,11 @@ def landing_page():
     st.markdown("<p style='text-align: center; font-size: 1.1rem; margin-bottom: 2rem;'>Monitor tree growth, track carbon sequestration, and support environmental action.</p>", unsafe_allow_html=True)
 
     # Metrics
-    trees = load_tree_data()
+    trees = load_tree_data(get_db_version())
     total_trees = len(trees)
     co2_sequestered = trees['co2_kg'].sum() if 'co2_kg' in trees.columns and not trees.empty else 0
-    survival_rate = (trees[trees['status'] == 'Alive'].shape[0] / total_trees * 100) if total_trees > 0 and 'status' in trees.columns else 0
+    status_counts = trees['status'].value_counts() if 'status' in trees.columns else pd.Series(dtype="int64")
+    survival_rate = (int(status_counts.get('Alive', 0)) / total_trees * 100) if total_trees > 0 else 0
     
     # MODIFIED: Changed 'institution_id' to 'institution'
     num_institutions = trees['institution'].nunique() if 'institution' in trees.columns and not trees.empty else 0
@@ -551,34 +427,33 @@ def landing_page():
     # Display some public data like recent trees map
     if not trees.empty:
         st.markdown("<h4 style='color: #1D7749; margin-top: 2rem; margin-bottom: 0.5rem;'>Recently Planted Trees</h4>", unsafe_allow_html=True)
-        recent_trees = trees.sort_values("date_planted", ascending=False).head(50)
-        if 'latitude' in recent_trees.columns and 'longitude' in recent_trees.columns:
-            # Filter out trees with missing coordinates
-            map_trees = recent_trees.dropna(subset=["latitude", "longitude"])
-            
-            if not map_trees.empty:
-                fig = px.scatter_mapbox(
-                    map_trees,
-                    lat="latitude", lon="longitude",
-                    hover_name="tree_id",
-                    # MODIFIED: Changed "institution_id" to "institution" to match the actual column name
-                    hover_data={
-                        "local_name": True, 
-                        "institution": True, # CORRECTED from "institution_id"
-                        "date_planted": True,
-                        "latitude": False, 
-                        "longitude": False
-                    },
-                    color="status",
-                    color_discrete_map={"Alive": "#28a745", "Dead": "#dc3545"},
-                    zoom=10, height=400
-                )
-                fig.update_layout(mapbox_style="carto-positron", margin={"r":0,"t":0,"l":0,"b":0})
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("No location data available for recent trees.")
+        map_points = load_recent_tree_locations(get_db_version())
+        if map_points:
+            layer = pdk.Layer(
+                "ScatterplotLayer",
+                data=map_points,
+                get_position=["longitude", "latitude"],
+                get_fill_color="color",
+                get_radius=60,
+                radius_min_pixels=4,
+                pickable=True
+            )
+            view_state = pdk.ViewState(
+                latitude=sum(point["latitude"] for point in map_points) / len(map_points),
+                longitude=sum(point["longitude"] for point in map_points) / len(map_points),
+                zoom=10
+            )
+            st.pydeck_chart(
+                pdk.Deck(
+                    layers=[layer],
+                    initial_view_state=view_state,
+                    map_style="light",
+                    tooltip={"text": "{tree_id}\n{local_name}\n{institution}\n{date_planted}"}
+                ),
+                height=400
+            )
         else:
-            st.info("No location data available for trees.")
+            st.info("No location data available for recent trees.")
 
 # --- Authentication Page ---
 def authentication_page_content():
@@ -680,13 +555,42 @@ def show_firebase_setup_guide(): # This function now directly uses its name, no
         else:
             st.error("Firebase authentication module is not available. Please check your installation.")
 
+# --- Navigation ---
+def sync_page_with_navigation():
+    st.session_state.page = st.session_state.navigation_radio
+
+@st.fragment
+def render_authenticated_page(page, user_role, default_page_for_user):
+    if page == "Admin Dashboard": admin_dashboard_content()
+    elif page == "User Dashboard": unified_user_dashboard_content()
+    elif page == "User Management": 
+        if user_role == "admin" and FIREBASE_AUTH_MODULE_AVAILABLE: firebase_admin_approval_ui()
+        else: st.error("Access Denied or Firebase module unavailable.")
+    elif page == "Tree Planting": 
+        # Allow individual, institution, and admin to plant trees
+        if user_role in ["individual", "institution", "admin"]:
+            plant_a_tree_section()
+        else:
+            # ADDED DEBUGGING INFO: Display the current user_role
+            st.error(f"Your account ({user_role}) doesn't have permissions to plant trees.") 
+    elif page == "Tree Monitoring": monitoring_section()
+    elif page == "Tree Lookup": 
+        if user_role == "admin": admin_tree_lookup()
+        else: st.error("Access Denied.")
+    elif page == "Firebase Setup":
+        if user_role == "admin": show_firebase_setup_guide() # Directly call the function name
+        else: st.error("Access Denied.")
+    else:
+        st.error("Page not found or access denied.")
+        st.session_state.page = default_page_for_user; st.rerun()
+
 # --- Main App Logic ---
 def main():
     init_db() # Initialize SQL DB for app data (not users)
     load_css()
 
     # Initialize Firebase if available
-    # The initialize_firebase function already sets st.session_state.firebase_db internally
+    # initialize_firebase returns the process-wide cached Firestore client
     if "firebase_initialized" not in st.session_state:
         if FIREBASE_AUTH_MODULE_AVAILABLE:
             st.session_state["firebase_initialized"] = initialize_firebase()
@@ -752,9 +656,8 @@ def main():
                 return
 
             current_selection_idx = nav_options.index(page) if page in nav_options else 0
-            selected_page = st.radio("Navigation", nav_options, index=current_selection_idx, key="navigation_radio", label_visibility="collapsed")
-            
-            if selected_page != page: st.session_state.page = selected_page; st.rerun()
+            st.radio("Navigation", nav_options, index=current_selection_idx, key="navigation_radio",
+                     label_visibility="collapsed", on_change=sync_page_with_navigation)
 
             st.markdown("<hr style='margin: 1rem 0;'>", unsafe_allow_html=True)
             if st.button("Logout", use_container_width=True, key="logout_button"):
@@ -762,28 +665,7 @@ def main():
                 st.session_state.page = "Landing"; st.rerun()
 
         # Render authenticated page
-        if page == "Admin Dashboard": admin_dashboard_content()
-        elif page == "User Dashboard": unified_user_dashboard_content()
-        elif page == "User Management": 
-            if user_role == "admin" and FIREBASE_AUTH_MODULE_AVAILABLE: firebase_admin_approval_ui()
-            else: st.error("Access Denied or Firebase module unavailable.")
-        elif page == "Tree Planting": 
-            # Allow individual, institution, and admin to plant trees
-            if user_role in ["individual", "institution", "admin"]:
-                plant_a_tree_section()
-            else:
-                # ADDED DEBUGGING INFO: Display the current user_role
-                st.error(f"Your account ({user_role}) doesn't have permissions to plant trees.") 
-        elif page == "Tree Monitoring": monitoring_section()
-        elif page == "Tree Lookup": 
-            if user_role == "admin": admin_tree_lookup()
-            else: st.error("Access Denied.")
-        elif page == "Firebase Setup":
-            if user_role == "admin": show_firebase_setup_guide() # Directly call the function name
-            else: st.error("Access Denied.")
-        else:
-            st.error("Page not found or access denied.")
-            st.session_state.page = default_page_for_user; st.rerun()
+        render_authenticated_page(page, user_role, default_page_for_user)
     else: # Not authenticated, and not a public page they are on
         st.session_state.page = "Landing"
         st.rerun()
@@ -1,14 +1,26 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-import qrcode
-import base64
-from io import BytesIO
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+import os
 import uuid
 import json
 import re
+import queue
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from string import Template
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional: AgGrid for the admin tables; st.dataframe is used without it
+try:
+    from st_aggrid import AgGrid, GridUpdateMode, DataReturnMode
+except ImportError:
+    AgGrid = None
 
 # Database configuration
 BASE_DIR = Path(__file__).parent if "__file__ in locals()" else Path.cwd()
@@ -20,322 +32,652 @@ CERT_DIR = DATA_DIR / "certificates"
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 CERT_DIR.mkdir(exist_ok=True, parents=True)
 
+# Donation settings (in a real app, tree cost might vary by species or region)
+TREE_COST = 5.00  # $5 per tree
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+# Columns the donation views and the certificate read; payment_id is never displayed
+DONATION_COLUMNS = (
+    "donation_id, donor_name, donor_email, institution, amount, tree_count, "
+    "donation_date, payment_status, certificate_path"
+)
+# Columns the admin records table shows
+ADMIN_DONATION_COLUMNS = (
+    "donation_id, donor_name, donor_email, institution, amount, tree_count, "
+    "donation_date, payment_status"
+)
+# Tree columns shown for a donation's trees
+DONATED_TREE_COLUMNS = "t.tree_id, t.local_name, t.scientific_name, t.date_planted, t.status, t.co2_kg"
+
+# Display headings for the tables
+TRACKED_DONATION_RENAME = {
+    'donation_id': 'Donation ID',
+    'donation_date': 'Date',
+    'institution': 'Institution',
+    'amount': 'Amount ($)',
+    'tree_count': 'Trees',
+    'payment_status': 'Status'
+}
+TREE_RENAME = {
+    'tree_id': 'Tree ID',
+    'local_name': 'Local Name',
+    'scientific_name': 'Scientific Name',
+    'date_planted': 'Date Planted',
+    'status': 'Status',
+    'co2_kg': 'CO₂ (kg)'
+}
+IMPACT_RENAME = {
+    'institution': 'Institution',
+    'total_trees': 'Total Trees',
+    'alive_trees': 'Alive Trees',
+    'co2_kg': 'CO₂ (kg)',
+    'donation_count': 'Donations',
+    'total_donations': 'Total Donated ($)',
+    'donated_trees': 'Trees Donated'
+}
+ADMIN_DONATION_RENAME = {
+    'donation_id': 'ID',
+    'donor_name': 'Donor Name',
+    'donor_email': 'Email',
+    'institution': 'Institution',
+    'amount': 'Amount',
+    'tree_count': 'Trees',
+    'donation_date': 'Date',
+    'payment_status': 'Status'
+}
+TRENDS_RENAME = {
+    'day': 'Date',
+    'donation_count': 'Donations',
+    'total_amount': 'Amount ($)',
+    'total_trees': 'Trees'
+}
+INSTITUTION_PERFORMANCE_RENAME = {
+    'institution': 'Institution',
+    'donation_count': 'Donations',
+    'total_amount': 'Total Amount ($)',
+    'total_trees': 'Total Trees',
+    'avg_donation': 'Average Donation ($)'
+}
+
+# Donation rows shown per page in the admin records table
+ADMIN_PAGE_SIZE = 100
+# Donation IDs offered in the admin details picker
+RECENT_DONATION_CHOICES = 50
+
+# Number of pooled read-only SQLite connections
+POOL_SIZE = os.cpu_count() or 4
+
+def _open_connection(read_only=True):
+    """Open a SQLite connection tuned for the dashboard's many small reads"""
+    conn = sqlite3.connect(SQLITE_DB, check_same_thread=False)
+    if read_only:
+        # Pooled readers can never take the write lock; all writes go through db_writer()
+        conn.execute("PRAGMA query_only=ON")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    return conn
+
+@st.cache_resource(show_spinner=False)
+def get_conn_pool():
+    """Create the process-wide pool of open read-only SQLite connections"""
+    pool = queue.Queue(maxsize=POOL_SIZE)
+    for _ in range(POOL_SIZE):
+        pool.put(_open_connection())
+    return pool
+
+@st.cache_resource(show_spinner=False)
+def get_db_writer():
+    """The single process-wide writer connection and the lock that serializes its use"""
+    conn = _open_connection(read_only=False)
+    # Write transactions open with BEGIN IMMEDIATE
+    conn.isolation_level = "IMMEDIATE"
+    return conn, threading.Lock()
+
+@contextmanager
+def db_writer():
+    """Hold the writer connection for the duration of a with block"""
+    conn, lock = get_db_writer()
+    with lock:
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+@contextmanager
+def db_conn():
+    """Borrow a pooled read-only connection for the duration of a with block"""
+    pool = get_conn_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        # Every pooled connection is in use; open a temporary one rather than block
+        conn = _open_connection()
+    try:
+        yield conn
+    finally:
+        # Never hand a connection with a half-finished transaction to the next caller
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@st.cache_resource(show_spinner=False)
+def get_data_versions():
+    """
+    Process-wide counters used as cache keys; bumped whenever donations or qualifications change
+    Cached readers take the current version as an argument they never read, so a write yields a new key
+    Returns the counters and the lock that serializes their updates
+    """
+    return {"donations_version": 0}, threading.Lock()
+
+def get_donations_version():
+    """Current donations version, passed to cached readers so a write yields a new cache key"""
+    versions, _ = get_data_versions()
+    return versions["donations_version"]
+
+def bump_donations_version():
+    """Invalidate every cached donation read after a write"""
+    versions, lock = get_data_versions()
+    # Concurrent writers run on separate script threads; an unlocked += can lose a bump
+    with lock:
+        versions["donations_version"] += 1
+
+def seed_default_qualifications(conn):
+    """If no institution is qualified yet, mark every institution with trees as qualified by default"""
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO institution_qualification (institution, qualified, qualification_reason, qualification_date)
+        SELECT DISTINCT institution, 1, 'Default qualification', ?
+        FROM trees
+        WHERE institution IS NOT NULL AND institution != ''
+          AND NOT EXISTS (SELECT 1 FROM institution_qualification WHERE qualified = 1)
+        """,
+        (datetime.now().isoformat(),)
+    )
+    conn.commit()
+
+def has_donated_trees_unique_index(conn):
+    """Whether donated_trees already has its UNIQUE (donation_id, tree_id) index"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_donated_trees_unique'"
+    ).fetchone() is not None
+
+def count_duplicate_donated_trees(conn):
+    """Number of donated_trees rows repeating an earlier (donation_id, tree_id) pair"""
+    return conn.execute("""
+        SELECT COALESCE(SUM(copies - 1), 0)
+        FROM (SELECT COUNT(*) AS copies FROM donated_trees GROUP BY donation_id, tree_id)
+    """).fetchone()[0]
+
+def create_donated_trees_unique_index(conn):
+    """
+    Record a tree once per donation, replacing the older donated_trees indexes with a UNIQUE one
+    Never deletes rows: returns False, leaving the table as it is, while duplicates remain
+    """
+    if has_donated_trees_unique_index(conn):
+        return True
+    if count_duplicate_donated_trees(conn):
+        return False
+    conn.execute("DROP INDEX IF EXISTS idx_donated_trees_donation")
+    conn.execute("DROP INDEX IF EXISTS idx_donated_trees_donation_tree")
+    conn.execute("CREATE UNIQUE INDEX idx_donated_trees_unique ON donated_trees(donation_id, tree_id)")
+    return True
+
+def remove_duplicate_donated_trees(conn):
+    """
+    Admin cleanup: keep the first record of each (donation_id, tree_id) pair, then create the unique index
+    Does nothing once the index exists; returns the number of rows removed
+    """
+    if has_donated_trees_unique_index(conn):
+        return 0
+    removed = conn.execute("""
+        DELETE FROM donated_trees
+        WHERE id NOT IN (SELECT MIN(id) FROM donated_trees GROUP BY donation_id, tree_id)
+    """).rowcount
+    create_donated_trees_unique_index(conn)
+    conn.commit()
+    logger.warning(f"Removed {removed} duplicate donated_trees rows")
+    return removed
+
+@st.cache_resource(show_spinner=False)
 def initialize_donor_database():
     """Initialize the database tables needed for donor functionality"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        c = conn.cursor()
+    with db_writer() as conn:
+        try:
+            c = conn.cursor()
         
-        # Create donations table if not exists
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS donations (
-                donation_id TEXT PRIMARY KEY,
-                donor_name TEXT,
-                donor_email TEXT,
-                institution TEXT,
-                amount REAL,
-                tree_count INTEGER,
-                donation_date TEXT,
-                payment_status TEXT,
-                payment_id TEXT,
-                certificate_path TEXT
-            )
-        ''')
-        conn.commit()
+            # Create donations table if not exists
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS donations (
+                    donation_id TEXT PRIMARY KEY,
+                    donor_name TEXT,
+                    donor_email TEXT,
+                    institution TEXT,
+                    amount REAL,
+                    tree_count INTEGER,
+                    donation_date TEXT,
+                    payment_status TEXT,
+                    payment_id TEXT,
+                    certificate_path TEXT
+                )
+            ''')
+            conn.commit()
         
-        # Create donated_trees table to track which trees were funded by donations
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS donated_trees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                donation_id TEXT,
-                tree_id TEXT,
-                FOREIGN KEY (donation_id) REFERENCES donations (donation_id),
-                FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
-            )
-        ''')
-        conn.commit()
+            # Create donated_trees table to track which trees were funded by donations
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS donated_trees (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    donation_id TEXT,
+                    tree_id TEXT,
+                    FOREIGN KEY (donation_id) REFERENCES donations (donation_id),
+                    FOREIGN KEY (tree_id) REFERENCES trees (tree_id)
+                )
+            ''')
+            conn.commit()
         
-        # Create institution_qualification table to track which institutions qualify for donations
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS institution_qualification (
-                institution TEXT PRIMARY KEY,
-                qualified BOOLEAN,
-                qualification_reason TEXT,
-                qualification_date TEXT
-            )
-        ''')
-        conn.commit()
+            # Create institution_qualification table to track which institutions qualify for donations
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS institution_qualification (
+                    institution TEXT PRIMARY KEY,
+                    qualified BOOLEAN,
+                    qualification_reason TEXT,
+                    qualification_date TEXT
+                )
+            ''')
+            conn.commit()
         
-    except Exception as e:
-        st.error(f"Error initializing donor database: {str(e)}")
-    finally:
-        conn.close()
-
-def get_qualifying_institutions():
-    """Get a list of institutions that qualify for donations"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        # First check the qualification table
-        qualified_df = pd.read_sql(
-            "SELECT institution FROM institution_qualification WHERE qualified = 1",
-            conn
-        )
+            # Day bucket for the donation trends report, derived from donation_date so it can be indexed.
+            # Generated columns need SQLite 3.31+; without one the report groups on date(donation_date)
+            donation_columns = {row[1] for row in c.execute("PRAGMA table_xinfo(donations)")}
+            if "donation_day" not in donation_columns:
+                try:
+                    c.execute("ALTER TABLE donations ADD COLUMN donation_day TEXT GENERATED ALWAYS AS (date(donation_date)) VIRTUAL")
+                    conn.commit()
+                    donation_columns.add("donation_day")
+                except sqlite3.OperationalError:
+                    pass
         
-        if not qualified_df.empty:
-            return qualified_df["institution"].tolist()
+            # The trees table belongs to the main app and may not exist yet
+            trees_exists = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trees'"
+            ).fetchone() is not None
+            if trees_exists:
+                seed_default_qualifications(conn)
         
-        # If no explicit qualifications, get all institutions with trees
-        institutions_df = pd.read_sql(
-            "SELECT DISTINCT institution FROM trees WHERE institution IS NOT NULL AND institution != ''",
-            conn
-        )
+            # Indexes for the institution, donor email and donated-tree lookups
+            if trees_exists:
+                c.execute("CREATE INDEX IF NOT EXISTS idx_trees_institution ON trees(institution)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_donations_email_date ON donations(donor_email, donation_date DESC)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_donations_inst_status ON donations(institution, payment_status)")
+            # Donation trends report
+            if "donation_day" in donation_columns:
+                c.execute("CREATE INDEX IF NOT EXISTS idx_donations_status_day ON donations(payment_status, donation_day, amount, tree_count)")
+            # Admin filter options and summary
+            c.execute("CREATE INDEX IF NOT EXISTS idx_donations_filter ON donations(payment_status, institution, donation_date, amount, tree_count)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_donated_trees_tree ON donated_trees(tree_id)")
+            if not create_donated_trees_unique_index(conn):
+                logger.warning(
+                    "donated_trees has duplicate assignments; remove them from the admin System Reports "
+                    "tab to enable the unique index"
+                )
+            conn.commit()
+            c.execute("ANALYZE")
+            conn.commit()
         
-        # Mark all as qualified by default
-        for institution in institutions_df["institution"]:
-            c = conn.cursor()
-            c.execute(
-                "INSERT OR REPLACE INTO institution_qualification (institution, qualified, qualification_reason, qualification_date) VALUES (?, 1, ?, ?)",
-                (institution, "Default qualification", datetime.now().isoformat())
-            )
-        conn.commit()
+            # Fold the write-ahead log back into the database file and truncate it
+            c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
         
-        return institutions_df["institution"].tolist()
+        except Exception as e:
+            st.error(f"Error initializing donor database: {str(e)}")
+            raise
+
+def get_qualifying_institutions():
+    """Get a list of institutions that qualify for donations"""
+    try:
+        return _get_qualifying_institutions_cached(get_donations_version())
     except Exception as e:
         st.error(f"Error getting qualifying institutions: {str(e)}")
         return []
-    finally:
-        conn.close()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_qualifying_institutions_cached(version):
+    """Cached body of get_qualifying_institutions"""
+    with db_conn() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT institution FROM institution_qualification WHERE qualified = 1"
+        )]
 
 def get_institution_stats(institution):
     """Get statistics for a specific institution"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        # Get tree counts
-        stats = pd.read_sql(
-            """
-            SELECT 
-                COUNT(*) as total_trees,
-                SUM(CASE WHEN status = 'Alive' THEN 1 ELSE 0 END) as alive_trees,
-                SUM(CASE WHEN status = 'Alive' THEN co2_kg ELSE 0 END) as co2_kg
-            FROM trees
-            WHERE institution = ?
-            """,
-            conn,
-            params=(institution,)
-        )
-        
-        # Get donation stats
-        donation_stats = pd.read_sql(
-            """
-            SELECT 
-                COUNT(*) as donation_count,
-                SUM(amount) as total_donations,
-                SUM(tree_count) as donated_trees
-            FROM donations
-            WHERE institution = ? AND payment_status = 'completed'
-            """,
-            conn,
-            params=(institution,)
-        )
-        
-        # Combine stats
-        result = {
-            "institution": institution,
-            "total_trees": int(stats["total_trees"].iloc[0]) if not stats.empty else 0,
-            "alive_trees": int(stats["alive_trees"].iloc[0]) if not stats.empty else 0,
-            "co2_kg": float(stats["co2_kg"].iloc[0]) if not stats.empty and stats["co2_kg"].iloc[0] is not None else 0.0,
-            "donation_count": int(donation_stats["donation_count"].iloc[0]) if not donation_stats.empty else 0,
-            "total_donations": float(donation_stats["total_donations"].iloc[0]) if not donation_stats.empty and donation_stats["total_donations"].iloc[0] is not None else 0.0,
-            "donated_trees": int(donation_stats["donated_trees"].iloc[0]) if not donation_stats.empty else 0
-        }
+    return _get_institution_stats_cached(institution, get_donations_version())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_institution_stats_cached(institution, version):
+    """Cached body of get_institution_stats"""
+    # On error every value stays None and falls back to 0 below, the same as for an empty institution
+    total_trees = alive_trees = co2_kg = donation_count = total_donations = donated_trees = None
+    with db_conn() as conn:
+        try:
+            c = conn.cursor()
+            # Get tree counts; SUM over no rows is NULL, so every value falls back to 0
+            total_trees, alive_trees, co2_kg = c.execute(
+                """
+                SELECT 
+                    COUNT(*) as total_trees,
+                    SUM(CASE WHEN status = 'Alive' THEN 1 ELSE 0 END) as alive_trees,
+                    SUM(CASE WHEN status = 'Alive' THEN co2_kg ELSE 0 END) as co2_kg
+                FROM trees
+                WHERE institution = ?
+                """,
+                (institution,)
+            ).fetchone()
         
-        # Calculate survival rate
-        if result["total_trees"] > 0:
-            result["survival_rate"] = (result["alive_trees"] / result["total_trees"]) * 100
-        else:
-            result["survival_rate"] = 0
-            
-        return result
-    except Exception as e:
-        st.error(f"Error getting institution stats: {str(e)}")
-        return {
-            "institution": institution,
-            "total_trees": 0,
-            "alive_trees": 0,
-            "co2_kg": 0.0,
-            "survival_rate": 0,
-            "donation_count": 0,
-            "total_donations": 0.0,
-            "donated_trees": 0
-        }
-    finally:
-        conn.close()
+            # Get donation stats
+            donation_count, total_donations, donated_trees = c.execute(
+                """
+                SELECT 
+                    COUNT(*) as donation_count,
+                    SUM(amount) as total_donations,
+                    SUM(tree_count) as donated_trees
+                FROM donations
+                WHERE institution = ? AND payment_status = 'completed'
+                """,
+                (institution,)
+            ).fetchone()
+        except Exception as e:
+            st.error(f"Error getting institution stats: {str(e)}")
+    
+    # Combine stats
+    total_trees = int(total_trees or 0)
+    alive_trees = int(alive_trees or 0)
+    return {
+        "institution": institution,
+        "total_trees": total_trees,
+        "alive_trees": alive_trees,
+        "co2_kg": float(co2_kg or 0.0),
+        "survival_rate": alive_trees / total_trees * 100 if total_trees > 0 else 0,
+        "donation_count": int(donation_count or 0),
+        "total_donations": float(total_donations or 0.0),
+        "donated_trees": int(donated_trees or 0)
+    }
+
+def get_all_institution_stats(institutions):
+    """Get statistics for several institutions at once, in the order given"""
+    return _get_all_institution_stats_cached(tuple(institutions), get_donations_version())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_all_institution_stats_cached(institutions, version):
+    """Cached body of get_all_institution_stats; one aggregate query per table"""
+    tree_columns = ["institution", "total_trees", "alive_trees", "co2_kg"]
+    donation_columns = ["institution", "donation_count", "total_donations", "donated_trees"]
+    with db_conn() as conn:
+        try:
+            tree_stats = pd.read_sql(
+                """
+                SELECT 
+                    institution,
+                    COUNT(*) as total_trees,
+                    SUM(CASE WHEN status = 'Alive' THEN 1 ELSE 0 END) as alive_trees,
+                    SUM(CASE WHEN status = 'Alive' THEN co2_kg ELSE 0 END) as co2_kg
+                FROM trees
+                WHERE institution IS NOT NULL AND institution != ''
+                GROUP BY institution
+                """,
+                conn
+            )
+            donation_stats = pd.read_sql(
+                """
+                SELECT 
+                    institution,
+                    COUNT(*) as donation_count,
+                    SUM(amount) as total_donations,
+                    SUM(tree_count) as donated_trees
+                FROM donations
+                WHERE payment_status = 'completed'
+                GROUP BY institution
+                """,
+                conn
+            )
+        except Exception as e:
+            st.error(f"Error getting institution stats: {str(e)}")
+            tree_stats = pd.DataFrame(columns=tree_columns)
+            donation_stats = pd.DataFrame(columns=donation_columns)
+    
+    # Institutions without trees or completed donations report zeros, as get_institution_stats does
+    stats_df = (
+        pd.DataFrame({"institution": list(institutions)})
+        .merge(tree_stats[tree_columns], on="institution", how="left")
+        .merge(donation_stats[donation_columns], on="institution", how="left")
+        .fillna(0)
+    )
+    return stats_df.astype({
+        "total_trees": int,
+        "alive_trees": int,
+        "co2_kg": float,
+        "donation_count": int,
+        "total_donations": float,
+        "donated_trees": int
+    })
 
 def create_donation(donor_name, donor_email, institution, amount, tree_count):
-    """Create a new donation record"""
+    """
+    Create a new donation record
+    Returns the inserted donation as a dict, so callers need not read it back
+    """
     donation_id = f"DON{uuid.uuid4().hex[:8].upper()}"
     donation_date = datetime.now().isoformat()
     
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        c = conn.cursor()
-        c.execute(
-            """
-            INSERT INTO donations 
-            (donation_id, donor_name, donor_email, institution, amount, tree_count, donation_date, payment_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (donation_id, donor_name, donor_email, institution, amount, tree_count, donation_date, "pending")
-        )
-        conn.commit()
-        return donation_id
-    except Exception as e:
-        st.error(f"Error creating donation: {str(e)}")
-        return None
-    finally:
-        conn.close()
-
-def update_payment_status(donation_id, payment_status, payment_id=None):
-    """Update the payment status for a donation"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        c = conn.cursor()
-        if payment_id:
-            c.execute(
-                "UPDATE donations SET payment_status = ?, payment_id = ? WHERE donation_id = ?",
-                (payment_status, payment_id, donation_id)
-            )
-        else:
+    with db_writer() as conn:
+        try:
+            c = conn.cursor()
             c.execute(
-                "UPDATE donations SET payment_status = ? WHERE donation_id = ?",
-                (payment_status, donation_id)
+                """
+                INSERT INTO donations 
+                (donation_id, donor_name, donor_email, institution, amount, tree_count, donation_date, payment_status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (donation_id, donor_name, donor_email, institution, amount, tree_count, donation_date, "pending")
             )
-        conn.commit()
+            conn.commit()
+            bump_donations_version()
+            return {
+                "donation_id": donation_id,
+                "donor_name": donor_name,
+                "donor_email": donor_email,
+                "institution": institution,
+                "amount": amount,
+                "tree_count": tree_count,
+                "donation_date": donation_date,
+                "payment_status": "pending",
+                "certificate_path": None
+            }
+        except Exception as e:
+            st.error(f"Error creating donation: {str(e)}")
+            return None
+
+def update_payment_status(donation_id, payment_status, payment_id=None, donation=None):
+    """
+    Update the payment status for a donation
+    Pass `donation` (a dict with the donation's fields) when the caller already has it,
+    to skip reading the row back before generating the certificate
+    Completing a donation that is already completed never assigns trees again;
+    it only retries the certificate if the first attempt left none
+    """
+    try:
+        cert_path = None
         
         # If payment is completed, generate certificate and assign trees
         if payment_status == "completed":
-            donation_data = pd.read_sql(
-                "SELECT * FROM donations WHERE donation_id = ?",
-                conn,
-                params=(donation_id,)
-            )
-            
-            if not donation_data.empty:
-                # Generate certificate
-                cert_path = generate_donation_certificate(donation_data.iloc[0])
+            with db_conn() as conn:
+                c = conn.cursor()
+                # Row factory on this cursor only, so fields stay addressable by name
+                c.row_factory = sqlite3.Row
+                if donation is None:
+                    current = donation = c.execute(
+                        f"SELECT {DONATION_COLUMNS} FROM donations WHERE donation_id = ?",
+                        (donation_id,)
+                    ).fetchone()
+                else:
+                    # The caller's copy may be stale, so the stored state decides
+                    current = c.execute(
+                        "SELECT payment_status, certificate_path FROM donations WHERE donation_id = ?",
+                        (donation_id,)
+                    ).fetchone()
                 
-                # Update certificate path
-                c.execute(
-                    "UPDATE donations SET certificate_path = ? WHERE donation_id = ?",
-                    (cert_path, donation_id)
-                )
-                conn.commit()
+                # A replayed completion (webhook retry, rerun) must not redraw the certificate or reassign trees
+                if current is not None and current["payment_status"] == "completed" and current["certificate_path"]:
+                    return True
                 
-                # Assign trees to donation
-                assign_trees_to_donation(donation_id, donation_data.iloc[0]["institution"], donation_data.iloc[0]["tree_count"])
+                if donation is not None:
+                    # CO₂ per alive tree at the institution; NULL when none are alive
+                    co2_per_tree = c.execute(
+                        """
+                        SELECT TOTAL(CASE WHEN status = 'Alive' THEN co2_kg ELSE 0 END)
+                               / NULLIF(SUM(CASE WHEN status = 'Alive' THEN 1 ELSE 0 END), 0)
+                        FROM trees
+                        WHERE institution = ?
+                        """,
+                        (donation["institution"],)
+                    ).fetchone()[0]
+            
+            # Generate certificate, before taking the write lock
+            if donation is not None:
+                cert_path = generate_donation_certificate(donation, co2_per_tree or 0)
         
+        with db_writer() as conn:
+            # Re-read under the lock, so a concurrent completion cannot assign trees twice
+            previous = conn.execute(
+                "SELECT payment_status FROM donations WHERE donation_id = ?",
+                (donation_id,)
+            ).fetchone()
+            already_completed = previous is not None and previous[0] == "completed"
+            
+            # Status, payment id and certificate path in one statement; missing values keep what is stored
+            conn.execute(
+                """
+                UPDATE donations
+                SET payment_status = ?,
+                    payment_id = COALESCE(?, payment_id),
+                    certificate_path = COALESCE(?, certificate_path)
+                WHERE donation_id = ?
+                """,
+                (payment_status, payment_id or None, cert_path, donation_id)
+            )
+            
+            if payment_status == "completed" and donation is not None and not already_completed:
+                # Assign trees to donation, inside the same transaction
+                assign_trees_to_donation(conn, donation_id, donation["institution"], donation["tree_count"])
+            
+            # A single commit for the status, the certificate path and the tree assignments
+            conn.commit()
+        bump_donations_version()
         return True
     except Exception as e:
         st.error(f"Error updating payment status: {str(e)}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
-def assign_trees_to_donation(donation_id, institution, tree_count):
-    """Assign trees to a donation"""
-    conn = sqlite3.connect(SQLITE_DB)
+def assign_trees_to_donation(conn, donation_id, institution, tree_count):
+    """
+    Assign trees to a donation
+    Runs on the caller's connection and leaves committing to the caller;
+    errors propagate so the caller rolls back the whole completion
+    """
+    # Assign this institution's unassigned trees
+    assigned = conn.execute(
+        """
+        INSERT OR IGNORE INTO donated_trees (donation_id, tree_id)
+        SELECT ?, tree_id
+        FROM trees
+        WHERE institution = ?
+          AND NOT EXISTS (SELECT 1 FROM donated_trees dt WHERE dt.tree_id = trees.tree_id)
+        LIMIT ?
+        """,
+        (donation_id, institution, tree_count)
+    ).rowcount
+    
+    if assigned == 0:
+        st.warning(f"No available trees to assign for donation {donation_id}")
+        return False
+    
+    # If not enough trees available, log a warning
+    if assigned < tree_count:
+        st.warning(f"Only {assigned} trees available for donation {donation_id}, which requested {tree_count} trees")
+        
+    return True
+
+# Certificate layout
+CERT_WIDTH, CERT_HEIGHT = 1200, 900
+CERT_GREEN = (46, 139, 87)
+CERT_BLACK = (0, 0, 0)
+
+@lru_cache(maxsize=1)
+def _cert_fonts():
+    """Load the certificate fonts once; returns (title, header, body)"""
+    from PIL import ImageFont
+
+    # Try to load fonts, fall back to default if not available
     try:
-        # Get unassigned trees for this institution
-        trees_df = pd.read_sql(
-            """
-            SELECT t.tree_id 
-            FROM trees t
-            LEFT JOIN donated_trees dt ON t.tree_id = dt.tree_id
-            WHERE t.institution = ? AND dt.tree_id IS NULL
-            LIMIT ?
-            """,
-            conn,
-            params=(institution, tree_count)
+        return (
+            ImageFont.truetype("arial.ttf", 60),
+            ImageFont.truetype("arial.ttf", 40),
+            ImageFont.truetype("arial.ttf", 30)
         )
-        
-        if trees_df.empty:
-            st.warning(f"No available trees to assign for donation {donation_id}")
-            return False
-            
-        # Assign trees to donation
-        c = conn.cursor()
-        for tree_id in trees_df["tree_id"]:
-            c.execute(
-                "INSERT INTO donated_trees (donation_id, tree_id) VALUES (?, ?)",
-                (donation_id, tree_id)
-            )
-        conn.commit()
-        
-        # If not enough trees available, log a warning
-        if len(trees_df) < tree_count:
-            st.warning(f"Only {len(trees_df)} trees available for donation {donation_id}, which requested {tree_count} trees")
-            
-        return True
-    except Exception as e:
-        st.error(f"Error assigning trees to donation: {str(e)}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+    except IOError:
+        default_font = ImageFont.load_default()
+        return default_font, default_font, default_font
+
+@lru_cache(maxsize=1)
+def _cert_template():
+    """Render the donation-independent parts of the certificate once; callers must copy it"""
+    from PIL import Image, ImageDraw
+
+    title_font, header_font, body_font = _cert_fonts()
+    template = Image.new('RGB', (CERT_WIDTH, CERT_HEIGHT), color=(255, 255, 255))
+    draw = ImageDraw.Draw(template)
 
-def generate_donation_certificate(donation_data):
-    """Generate a certificate for a donation"""
+    # Border, title, fixed wording and footer
+    draw.rectangle([(20, 20), (CERT_WIDTH - 20, CERT_HEIGHT - 20)], outline=CERT_GREEN, width=10)
+    draw.text((CERT_WIDTH // 2, 100), "Certificate of Donation", fill=CERT_GREEN, font=title_font, anchor="mm")
+    draw.text((CERT_WIDTH // 2, 200), "This certifies that", fill=CERT_BLACK, font=body_font, anchor="mm")
+    draw.text((CERT_WIDTH // 2, 350), "has generously donated", fill=CERT_BLACK, font=body_font, anchor="mm")
+    draw.text((CERT_WIDTH // 2, 800), "🌱 CarbonTally", fill=CERT_GREEN, font=header_font, anchor="mm")
+    return template
+
+def generate_donation_certificate(donation_data, co2_per_tree=0):
+    """Generate a certificate for a donation; `co2_per_tree` is the institution's CO₂ per alive tree"""
     try:
-        from PIL import Image, ImageDraw, ImageFont
-        from pathlib import Path
-        from datetime import datetime
+        from PIL import ImageDraw
 
         # Create a unique filename
         filename = f"certificate_{donation_data['donation_id']}.png"
         file_path = CERT_DIR / filename
 
-        # Get institution stats
-        institution_stats = get_institution_stats(donation_data["institution"])
-
-        # Create certificate image
-        width, height = 1200, 900
-        certificate = Image.new('RGB', (width, height), color=(255, 255, 255))
+        # Start from the pre-rendered template and draw only the donation details
+        certificate = _cert_template().copy()
         draw = ImageDraw.Draw(certificate)
+        _, header_font, body_font = _cert_fonts()
+        center = CERT_WIDTH // 2
 
-        # Try to load fonts, fall back to default if not available
-        try:
-            title_font = ImageFont.truetype("arial.ttf", 60)
-            header_font = ImageFont.truetype("arial.ttf", 40)
-            body_font = ImageFont.truetype("arial.ttf", 30)
-        except IOError:
-            title_font = ImageFont.load_default()
-            header_font = ImageFont.load_default()
-            body_font = ImageFont.load_default()
-
-        # Add border
-        draw.rectangle([(20, 20), (width - 20, height - 20)], outline=(46, 139, 87), width=10)
-
-        # Add title and details
-        draw.text((width // 2, 100), "Certificate of Donation", fill=(46, 139, 87), font=title_font, anchor="mm")
-        draw.text((width // 2, 200), "This certifies that", fill=(0, 0, 0), font=body_font, anchor="mm")
-        draw.text((width // 2, 250), donation_data['donor_name'], fill=(0, 0, 0), font=header_font, anchor="mm")
-        draw.text((width // 2, 350), "has generously donated", fill=(0, 0, 0), font=body_font, anchor="mm")
-        draw.text((width // 2, 400), f"${donation_data['amount']:.2f}", fill=(46, 139, 87), font=header_font, anchor="mm")
-        draw.text((width // 2, 450), f"to support {donation_data['tree_count']} trees at", fill=(0, 0, 0), font=body_font, anchor="mm")
-        draw.text((width // 2, 500), donation_data['institution'], fill=(0, 0, 0), font=header_font, anchor="mm")
+        draw.text((center, 250), donation_data['donor_name'], fill=CERT_BLACK, font=header_font, anchor="mm")
+        draw.text((center, 400), f"${donation_data['amount']:.2f}", fill=CERT_GREEN, font=header_font, anchor="mm")
+        draw.text((center, 450), f"to support {donation_data['tree_count']} trees at", fill=CERT_BLACK, font=body_font, anchor="mm")
+        draw.text((center, 500), donation_data['institution'], fill=CERT_BLACK, font=header_font, anchor="mm")
 
         # Add impact
-        co2_impact = (
-            institution_stats["co2_kg"] / institution_stats["alive_trees"] * donation_data["tree_count"]
-            if institution_stats["alive_trees"] > 0 else 0
-        )
-        draw.text((width // 2, 600), f"Estimated CO₂ Impact: {co2_impact:.2f} kg", fill=(0, 0, 0), font=body_font, anchor="mm")
+        co2_impact = co2_per_tree * donation_data["tree_count"]
+        draw.text((center, 600), f"Estimated CO₂ Impact: {co2_impact:.2f} kg", fill=CERT_BLACK, font=body_font, anchor="mm")
 
-        # Add date and footer
+        # Add date
         donation_date = datetime.fromisoformat(donation_data["donation_date"]).strftime("%B %d, %Y")
-        draw.text((width // 2, 700), f"Donation Date: {donation_date}", fill=(0, 0, 0), font=body_font, anchor="mm")
-        draw.text((width // 2, 800), "🌱 CarbonTally", fill=(46, 139, 87), font=header_font, anchor="mm")
+        draw.text((center, 700), f"Donation Date: {donation_date}", fill=CERT_BLACK, font=body_font, anchor="mm")
 
         # Save certificate
         certificate.save(file_path)
@@ -345,103 +687,354 @@ def generate_donation_certificate(donation_data):
         st.error(f"Error generating certificate: {str(e)}")
         return None
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def _load_certificate_bytes(path, mtime):
+    """Read a certificate PNG; keyed on `mtime` so a regenerated file is read again"""
+    return Path(path).read_bytes()
+
+def get_certificate_bytes(path):
+    """Get the bytes of a certificate file, cached until the file changes"""
+    return _load_certificate_bytes(path, os.path.getmtime(path))
 
 def get_donation_by_id(donation_id):
     """Get donation details by ID"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        donation_data = pd.read_sql(
-            "SELECT * FROM donations WHERE donation_id = ?",
-            conn,
-            params=(donation_id,)
-        )
+    with db_conn() as conn:
+        try:
+            c = conn.cursor()
+            c.row_factory = sqlite3.Row
+            # The donation with its assigned trees as a JSON array
+            donation = c.execute(
+                f"""
+                SELECT {DONATION_COLUMNS},
+                    (
+                        SELECT json_group_array(json_object(
+                            'tree_id', t.tree_id,
+                            'local_name', t.local_name,
+                            'scientific_name', t.scientific_name,
+                            'date_planted', t.date_planted,
+                            'status', t.status,
+                            'co2_kg', t.co2_kg
+                        ))
+                        FROM trees t
+                        JOIN donated_trees dt ON t.tree_id = dt.tree_id
+                        WHERE dt.donation_id = donations.donation_id
+                    ) AS trees_json
+                FROM donations
+                WHERE donation_id = ?
+                """,
+                (donation_id,)
+            ).fetchone()
         
-        if donation_data.empty:
-            return None
-            
-        # Get assigned trees
-        trees_df = pd.read_sql(
-            """
-            SELECT t.* 
-            FROM trees t
-            JOIN donated_trees dt ON t.tree_id = dt.tree_id
-            WHERE dt.donation_id = ?
-            """,
-            conn,
-            params=(donation_id,)
-        )
+            if donation is None:
+                return None
         
-        result = donation_data.iloc[0].to_dict()
-        result["trees"] = trees_df.to_dict('records') if not trees_df.empty else []
+            result = dict(donation)
+            # Trees stay a DataFrame; the views render them as a table
+            result["trees"] = pd.DataFrame(json.loads(result.pop("trees_json")), columns=list(TREE_RENAME))
         
-        return result
-    except Exception as e:
-        st.error(f"Error getting donation: {str(e)}")
-        return None
-    finally:
-        conn.close()
+            return result
+        except Exception as e:
+            st.error(f"Error getting donation: {str(e)}")
+            return None
 
 def get_donations_by_email(email):
     """Get all donations for a specific email address"""
-    conn = sqlite3.connect(SQLITE_DB)
-    try:
-        donations_df = pd.read_sql(
-            "SELECT * FROM donations WHERE donor_email = ? ORDER BY donation_date DESC",
+    return _get_donations_by_email_cached(email, get_donations_version())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_donations_by_email_cached(email, version):
+    """Cached body of get_donations_by_email"""
+    with db_conn() as conn:
+        try:
+            c = conn.cursor()
+            c.row_factory = sqlite3.Row
+            return [dict(row) for row in c.execute(
+                f"SELECT {DONATION_COLUMNS} FROM donations WHERE donor_email = ? ORDER BY donation_date DESC",
+                (email,)
+            )]
+        except Exception as e:
+            st.error(f"Error getting donations by email: {str(e)}")
+            return []
+
+def get_full_donations_by_email(email):
+    """
+    Get all donations for a specific email address, each with its assigned trees
+    Two queries in total, however many donations the donor has
+    """
+    return _get_full_donations_by_email_cached(email, get_donations_version())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _get_full_donations_by_email_cached(email, version):
+    """Cached body of get_full_donations_by_email"""
+    with db_conn() as conn:
+        try:
+            c = conn.cursor()
+            c.row_factory = sqlite3.Row
+            donations = [dict(row) for row in c.execute(
+                f"SELECT {DONATION_COLUMNS} FROM donations WHERE donor_email = ? ORDER BY donation_date DESC",
+                (email,)
+            )]
+            
+            if not donations:
+                return []
+            
+            trees_df = pd.read_sql(
+                f"""
+                SELECT dt.donation_id, {DONATED_TREE_COLUMNS}
+                FROM trees t
+                JOIN donated_trees dt ON t.tree_id = dt.tree_id
+                JOIN donations d ON d.donation_id = dt.donation_id
+                WHERE d.donor_email = ?
+                """,
+                conn,
+                params=(email,)
+            )
+        except Exception as e:
+            st.error(f"Error getting donations by email: {str(e)}")
+            return []
+    
+    # Group the trees once and attach each donation's group as a DataFrame
+    trees_df = trees_df.set_index("donation_id")
+    no_trees = trees_df.iloc[0:0]
+    trees_by_donation = {
+        donation_id: group for donation_id, group in trees_df.groupby(level="donation_id")
+    }
+    for donation in donations:
+        donation["trees"] = trees_by_donation.get(donation["donation_id"], no_trees)
+    return donations
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_donation_filter_options(version):
+    """Statuses, institutions and the date span offered by the admin filters"""
+    # One pass over donations: one row per (status, institution) pair with its date span
+    with db_conn() as conn:
+        groups = conn.execute(
+            """
+            SELECT payment_status, institution, MIN(donation_date), MAX(donation_date)
+            FROM donations
+            GROUP BY payment_status, institution
+            """
+        ).fetchall()
+    
+    first_dates = [first for _, _, first, _ in groups if first is not None]
+    last_dates = [last for _, _, _, last in groups if last is not None]
+    return {
+        "statuses": sorted({status for status, _, _, _ in groups if status is not None}),
+        "institutions": sorted({institution for _, institution, _, _ in groups if institution is not None}),
+        "first_date": min(first_dates, default=None),
+        "last_date": max(last_dates, default=None)
+    }
+
+def _donation_filter_clause(status, institution, start_date, end_date):
+    """Build the WHERE clause and parameters for the admin donation filters"""
+    where = "WHERE 1=1"
+    params = []
+    if status != "All":
+        where += " AND payment_status = ?"
+        params.append(status)
+    if institution != "All":
+        where += " AND institution = ?"
+        params.append(institution)
+    if start_date and end_date:
+        # donation_date is an ISO timestamp, so ISO date bounds compare correctly; the end date is inclusive
+        where += " AND donation_date >= ? AND donation_date < ?"
+        params.extend([start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()])
+    return where, params
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_filtered_donations(status, institution, start_date, end_date, page, version):
+    """One page of the donations matching the admin filters, filtered in SQL"""
+    where, params = _donation_filter_clause(status, institution, start_date, end_date)
+    with db_conn() as conn:
+        return pd.read_sql(
+            f"SELECT {ADMIN_DONATION_COLUMNS} FROM donations {where} ORDER BY donation_date DESC LIMIT ? OFFSET ?",
             conn,
-            params=(email,)
+            params=params + [ADMIN_PAGE_SIZE, (page - 1) * ADMIN_PAGE_SIZE],
+            dtype={"tree_count": "Int32"}
         )
-        
-        return donations_df.to_dict('records') if not donations_df.empty else []
-    except Exception as e:
-        st.error(f"Error getting donations by email: {str(e)}")
-        return []
-    finally:
-        conn.close()
 
-def display_paypal_button(donation_id, amount):
-    """Display a PayPal donation button"""
-    # In a production environment, you would use the PayPal SDK
-    # This is a simplified version for demonstration purposes
+@st.cache_data(ttl=60, show_spinner=False)
+def load_donation_display(status, institution, start_date, end_date, page, version):
+    """One page of the admin donation records, formatted for display"""
+    display_df = load_filtered_donations(status, institution, start_date, end_date, page, version)
+    display_df = display_df.rename(columns=ADMIN_DONATION_RENAME)
+    display_df['Amount'] = "$" + display_df['Amount'].map("{:,.2f}".format)
+    display_df['Date'] = pd.to_datetime(display_df['Date']).dt.strftime('%Y-%m-%d %H:%M')
+    return display_df
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_filtered_donation_summary(status, institution, start_date, end_date, version):
+    """Count and totals for the donations matching the admin filters"""
+    where, params = _donation_filter_clause(status, institution, start_date, end_date)
+    with db_conn() as conn:
+        donation_count, total_amount, total_trees, completed = conn.execute(
+            f"""
+            SELECT COUNT(*), SUM(amount), SUM(tree_count),
+                   SUM(CASE WHEN payment_status = 'completed' THEN 1 ELSE 0 END)
+            FROM donations {where}
+            """,
+            params
+        ).fetchone()
+    return {
+        "donation_count": donation_count,
+        "total_amount": total_amount or 0.0,
+        "total_trees": total_trees or 0,
+        "completed": completed or 0
+    }
+
+def _query_frame(conn, sql, dtypes, params=()):
+    """
+    Build a DataFrame straight from cursor rows with declared dtypes, instead of pd.read_sql inference
+    Counts are declared as 32-bit integers, which halves their Arrow payload; money stays float64
+    """
+    cursor = conn.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns).astype(dtypes)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_institution_overview(version):
+    """
+    Qualification status and donation totals per institution, for the admin tab
+    Returns (institutions_df, totals), the totals being computed by window functions over the same query
+    """
+    with db_conn() as conn:
+        institutions_df = _query_frame(conn, """
+            SELECT 
+                i.institution,
+                COALESCE(i.qualified, 0) as qualified,
+                i.qualification_reason,
+                i.qualification_date,
+                COUNT(d.donation_id) as donation_count,
+                SUM(d.amount) as total_donations,
+                SUM(d.tree_count) as total_trees_donated,
+                COUNT(*) OVER () as institution_total,
+                SUM(COALESCE(i.qualified, 0)) OVER () as qualified_total,
+                SUM(SUM(d.amount)) OVER () as donations_total
+            FROM institution_qualification i
+            LEFT JOIN donations d ON i.institution = d.institution
+            GROUP BY i.institution
+            ORDER BY i.institution
+        """, {
+            "qualified": "int8",
+            "donation_count": "int32",
+            "total_donations": "float64",
+            "total_trees_donated": "Int32"
+        })
     
-    paypal_html = f"""
-    <div id="paypal-button-container-{donation_id}"></div>
+    total_columns = ["institution_total", "qualified_total", "donations_total"]
+    if institutions_df.empty:
+        totals = dict.fromkeys(total_columns, 0)
+    else:
+        totals = institutions_df[total_columns].iloc[0].fillna(0).to_dict()
+    return institutions_df.drop(columns=total_columns).set_index("institution", drop=False), totals
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_donation_reports(version):
+    """Daily donation trends and per-institution performance, for the admin reports"""
+    with db_conn() as conn:
+        donation_columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(donations)")}
+        day = "donation_day" if "donation_day" in donation_columns else "date(donation_date)"
+        donation_trends = _query_frame(conn, f"""
+            SELECT 
+                {day} as day,
+                COUNT(*) as donation_count,
+                SUM(amount) as total_amount,
+                SUM(tree_count) as total_trees
+            FROM donations
+            WHERE payment_status = 'completed'
+            GROUP BY day
+            ORDER BY day
+        """, {"donation_count": "int32", "total_amount": "float64", "total_trees": "Int32"})
+        institution_performance = _query_frame(conn, """
+            SELECT 
+                institution,
+                COUNT(*) as donation_count,
+                SUM(amount) as total_amount,
+                SUM(tree_count) as total_trees,
+                AVG(amount) as avg_donation
+            FROM donations
+            WHERE payment_status = 'completed'
+            GROUP BY institution
+            ORDER BY total_amount DESC
+        """, {
+            "donation_count": "int32",
+            "total_amount": "float64",
+            "total_trees": "Int32",
+            "avg_donation": "float64"
+        })
+    return donation_trends, institution_performance
+
+def show_table(df, key, hide_index=None):
+    """Render a read-only admin table, through AgGrid when it is installed"""
+    if AgGrid is None:
+        st.dataframe(df, hide_index=hide_index)
+        return
+    AgGrid(
+        df,
+        update_mode=GridUpdateMode.NO_UPDATE,
+        data_return_mode=DataReturnMode.FILTERED,
+        reload_data=False,
+        key=key
+    )
+
+def select_options(state_key, placeholder, values, version):
+    """Selectbox choices for a column, kept in session state until the data changes"""
+    sig = (version, len(values), tuple(values.iloc[:1]), tuple(values.iloc[-1:]))
+    sig_key = f"{state_key}_sig"
+    if st.session_state.get(sig_key) != sig:
+        st.session_state[state_key] = (placeholder,) + tuple(values.tolist())
+        st.session_state[sig_key] = sig
+    return st.session_state[state_key]
+
+# PayPal button markup
+PAYPAL_BUTTON_TEMPLATE = Template("""
+    <div id="paypal-button-container-$donation_id"></div>
     <script src="https://www.paypal.com/sdk/js?client-id=test&currency=USD"></script>
     <script>
-      paypal.Buttons({{
-        createOrder: function(data, actions) {{
-          return actions.order.create({{
-            purchase_units: [{{
-              amount: {{
-                value: '{amount:.2f}'
-              }}
-            }}]
-          }});
-        }},
-        onApprove: function(data, actions) {{
-          return actions.order.capture().then(function(details) {{
+      paypal.Buttons({
+        createOrder: function(data, actions) {
+          return actions.order.create({
+            purchase_units: [{
+              amount: {
+                value: '$amount'
+              }
+            }]
+          });
+        },
+        onApprove: function(data, actions) {
+          return actions.order.capture().then(function(details) {
             // Call your server to update the payment status
-            window.parent.postMessage({{
+            window.parent.postMessage({
               type: 'payment_completed',
-              donation_id: '{donation_id}',
+              donation_id: '$donation_id',
               payment_id: details.id
-            }}, '*');
+            }, '*');
             
             // Show a success message
             alert('Payment completed! Thank you for your donation.');
             
             // Reload the page to show updated status
             window.parent.location.reload();
-          }});
-        }}
-      }}).render('#paypal-button-container-{donation_id}');
+          });
+        }
+      }).render('#paypal-button-container-$donation_id');
     </script>
-    """
+    """)
+
+def display_paypal_button(donation):
+    """Display a PayPal donation button"""
+    # In a production environment, you would use the PayPal SDK
+    # This is a simplified version for demonstration purposes
+    donation_id = donation["donation_id"]
+    amount = donation["amount"]
+    
+    paypal_html = PAYPAL_BUTTON_TEMPLATE.substitute(donation_id=donation_id, amount=f"{amount:.2f}")
     
     st.components.v1.html(paypal_html, height=100)
     
     # For testing purposes, add a button to simulate payment completion
     if st.button(f"Simulate Payment Completion for {donation_id}"):
-        update_payment_status(donation_id, "completed", f"SIMULATED-{uuid.uuid4().hex[:8].upper()}")
+        update_payment_status(donation_id, "completed", f"SIMULATED-{uuid.uuid4().hex[:8].upper()}", donation=donation)
         st.success("Payment simulation completed! Refreshing page...")
         st.rerun()
 
@@ -450,7 +1043,11 @@ def donor_dashboard():
     st.title("🌳 Tree Donation Dashboard")
     
     # Initialize database tables if needed
-    initialize_donor_database()
+    try:
+        initialize_donor_database()
+    except sqlite3.Error:
+        # Already reported; the failure is not cached, so the next run retries
+        pass
     
     # Create tabs for different sections
     tab1, tab2, tab3 = st.tabs(["Donate Trees", "Track Your Donations", "Impact Dashboard"])
@@ -504,14 +1101,11 @@ def donate_trees_section():
     # Donation form
     st.subheader("Your Donation")
     
-    # Calculate tree cost (in a real app, this might vary by species or region)
-    tree_cost = 5.00  # $5 per tree
-    
     # Tree count selection
     tree_count = st.number_input("Number of trees to donate", min_value=1, value=5)
-    donation_amount = tree_count * tree_cost
+    donation_amount = tree_count * TREE_COST
     
-    st.info(f"Donation amount: ${donation_amount:.2f} (${tree_cost:.2f} per tree)")
+    st.info(f"Donation amount: ${donation_amount:.2f} (${TREE_COST:.2f} per tree)")
     
     # Donor information
     st.subheader("Your Information")
@@ -519,7 +1113,7 @@ def donate_trees_section():
     donor_email = st.text_input("Your Email")
     
     # Validate inputs
-    if not donor_name or not donor_email or not re.match(r"[^@]+@[^@]+\.[^@]+", donor_email):
+    if not donor_name or not donor_email or not EMAIL_RE.match(donor_email):
         st.warning("Please provide your name and a valid email address.")
         proceed_button_disabled = True
     else:
@@ -528,24 +1122,20 @@ def donate_trees_section():
     # Proceed to payment
     if st.button("Proceed to Payment", disabled=proceed_button_disabled):
         # Create donation record
-        donation_id = create_donation(donor_name, donor_email, selected_institution, donation_amount, tree_count)
+        donation = create_donation(donor_name, donor_email, selected_institution, donation_amount, tree_count)
         
-        if donation_id:
-            st.session_state.current_donation_id = donation_id
-            st.session_state.current_donation_amount = donation_amount
+        if donation:
+            st.session_state.current_donation = donation
             st.success(f"Donation created! Please complete the payment below.")
             st.session_state.show_payment = True
             st.rerun()
     
     # Show payment options if donation was created
-    if st.session_state.get("show_payment", False) and st.session_state.get("current_donation_id"):
+    if st.session_state.get("show_payment", False) and st.session_state.get("current_donation"):
         st.subheader("Complete Your Payment")
         st.write("Please complete your payment using PayPal:")
         
-        display_paypal_button(
-            st.session_state.current_donation_id,
-            st.session_state.current_donation_amount
-        )
+        display_paypal_button(st.session_state.current_donation)
 
 def track_donations_section():
     """Interface for tracking donations"""
@@ -559,78 +1149,97 @@ def track_donations_section():
     tracking_email = st.text_input("Your Email Address")
     
     if st.button("Find My Donations", disabled=not tracking_email):
-        if not re.match(r"[^@]+@[^@]+\.[^@]+", tracking_email):
+        if not EMAIL_RE.match(tracking_email):
             st.error("Please enter a valid email address.")
             return
-            
-        # Get donations for this email
-        donations = get_donations_by_email(tracking_email)
         
-        if not donations:
-            st.info("No donations found for this email address.")
-            return
-            
-        st.success(f"Found {len(donations)} donation(s) for {tracking_email}")
+        # Remember the lookup so that selecting a row (which reruns the script) keeps the results on screen
+        st.session_state.tracked_email = tracking_email
+    
+    tracked_email = st.session_state.get("tracked_email")
+    if not tracked_email:
+        return
         
-        # Display donations
-        for donation in donations:
-            with st.expander(f"Donation {donation['donation_id']} - {donation['donation_date'][:10]}"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**Institution:** {donation['institution']}")
-                    st.write(f"**Amount:** ${donation['amount']:.2f}")
-                    st.write(f"**Trees:** {donation['tree_count']}")
-                    st.write(f"**Status:** {donation['payment_status'].title()}")
-                
-                with col2:
-                    # If payment is completed and certificate exists
-                    if donation['payment_status'] == 'completed' and donation['certificate_path']:
-                        try:
-                            # Display certificate
-                            from PIL import Image
-                            cert_image = Image.open(donation['certificate_path'])
-                            st.image(cert_image, caption="Donation Certificate", width=300)
-                            
-                            # Download button
-                            with open(donation['certificate_path'], "rb") as file:
-                                st.download_button(
-                                    label="Download Certificate",
-                                    data=file,
-                                    file_name=f"CarbonTally_Certificate_{donation['donation_id']}.png",
-                                    mime="image/png"
-                                )
-                        except Exception as e:
-                            st.error(f"Error displaying certificate: {str(e)}")
-                    elif donation['payment_status'] == 'pending':
-                        st.warning("Payment pending. Please complete your payment to receive your certificate.")
-                        display_paypal_button(donation['donation_id'], donation['amount'])
+    # Get donations for this email
+    donations = get_full_donations_by_email(tracked_email)
+    
+    if not donations:
+        st.info("No donations found for this email address.")
+        return
+        
+    st.success(f"Found {len(donations)} donation(s) for {tracked_email}")
+    
+    # One summary table; details are shown for the selected row
+    summary_df = pd.DataFrame(donations)[
+        ['donation_id', 'donation_date', 'institution', 'amount', 'tree_count', 'payment_status']
+    ]
+    summary_df['donation_date'] = summary_df['donation_date'].str[:10]
+    summary_df['payment_status'] = summary_df['payment_status'].str.title()
+    summary_df = summary_df.rename(columns=TRACKED_DONATION_RENAME)
+    
+    selection = st.dataframe(
+        summary_df,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="tracked_donations_table"
+    )
+    
+    selected_rows = selection.selection.rows
+    if not selected_rows:
+        st.info("Select a donation in the table to view its certificate and trees.")
+        return
+        
+    donation_details_section(donations[selected_rows[0]])
+
+@st.fragment
+def donation_details_section(donation):
+    """Details for a single tracked donation; widgets in here only rerun this fragment"""
+    st.subheader(f"Donation {donation['donation_id']} - {donation['donation_date'][:10]}")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.write(f"**Institution:** {donation['institution']}")
+        st.write(f"**Amount:** ${donation['amount']:.2f}")
+        st.write(f"**Trees:** {donation['tree_count']}")
+        st.write(f"**Status:** {donation['payment_status'].title()}")
+    
+    with col2:
+        # If payment is completed and certificate exists
+        if donation['payment_status'] == 'completed' and donation['certificate_path']:
+            try:
+                # Display certificate
+                cert_bytes = get_certificate_bytes(donation['certificate_path'])
+                st.image(cert_bytes, caption="Donation Certificate", width=300)
                 
-                # If payment is completed, show the trees
-                if donation['payment_status'] == 'completed':
-                    # Get full donation details including trees
-                    full_donation = get_donation_by_id(donation['donation_id'])
-                    
-                    if full_donation and full_donation['trees']:
-                        st.subheader("Your Trees")
-                        
-                        # Create a dataframe for display
-                        trees_df = pd.DataFrame(full_donation['trees'])
-                        
-                        # Select columns to display
-                        display_cols = ['tree_id', 'local_name', 'scientific_name', 'date_planted', 'status', 'co2_kg']
-                        display_df = trees_df[display_cols].rename(columns={
-                            'tree_id': 'Tree ID',
-                            'local_name': 'Local Name',
-                            'scientific_name': 'Scientific Name',
-                            'date_planted': 'Date Planted',
-                            'status': 'Status',
-                            'co2_kg': 'CO₂ (kg)'
-                        })
-                        
-                        st.dataframe(display_df)
-                    else:
-                        st.info("Trees are being assigned to your donation.")
+                # Download button
+                st.download_button(
+                    label="Download Certificate",
+                    data=cert_bytes,
+                    file_name=f"CarbonTally_Certificate_{donation['donation_id']}.png",
+                    mime="image/png"
+                )
+            except Exception as e:
+                st.error(f"Error displaying certificate: {str(e)}")
+        elif donation['payment_status'] == 'pending':
+            st.warning("Payment pending. Please complete your payment to receive your certificate.")
+            display_paypal_button(donation)
+    
+    # If payment is completed, show the trees
+    if donation['payment_status'] == 'completed':
+        # Trees were prefetched with the donor's donations
+        if not donation['trees'].empty:
+            st.subheader("Your Trees")
+            
+            # Already a DataFrame from the data layer
+            trees_df = donation['trees']
+            
+            # Select columns to display
+            display_df = trees_df[list(TREE_RENAME)].rename(columns=TREE_RENAME)
+            
+            st.dataframe(display_df)
+        else:
+            st.info("Trees are being assigned to your donation.")
 
 def impact_dashboard_section():
     """Interface for viewing overall impact (without graphs/charts)"""
@@ -643,14 +1252,8 @@ def impact_dashboard_section():
         st.warning("No qualifying institutions found.")
         return
     
-    # Get stats for all institutions
-    all_stats = []
-    for institution in qualifying_institutions:
-        stats = get_institution_stats(institution)
-        all_stats.append(stats)
-    
-    # Create a dataframe for display
-    stats_df = pd.DataFrame(all_stats)
+    # Get stats for all institutions in one pass
+    stats_df = get_all_institution_stats(qualifying_institutions)
     
     # Calculate totals
     total_trees = stats_df['total_trees'].sum()
@@ -686,19 +1289,11 @@ def impact_dashboard_section():
     # Prepare data for display
     display_df = stats_df[['institution', 'total_trees', 'alive_trees', 'co2_kg', 
                           'donation_count', 'total_donations', 'donated_trees']]
-    display_df = display_df.rename(columns={
-        'institution': 'Institution',
-        'total_trees': 'Total Trees',
-        'alive_trees': 'Alive Trees',
-        'co2_kg': 'CO₂ (kg)',
-        'donation_count': 'Donations',
-        'total_donations': 'Total Donated ($)',
-        'donated_trees': 'Trees Donated'
-    })
+    display_df = display_df.rename(columns=IMPACT_RENAME)
     
     # Format columns
-    display_df['Total Donated ($)'] = display_df['Total Donated ($)'].apply(lambda x: f"${x:,.2f}")
-    display_df['CO₂ (kg)'] = display_df['CO₂ (kg)'].apply(lambda x: f"{x:,.2f}")
+    display_df['Total Donated ($)'] = "$" + display_df['Total Donated ($)'].map("{:,.2f}".format)
+    display_df['CO₂ (kg)'] = display_df['CO₂ (kg)'].map("{:,.2f}".format)
     
     # Display the table
     st.dataframe(display_df)
@@ -724,97 +1319,83 @@ def admin_dashboard():
         # Donation Records
         st.header("Donation Records")
         
-        # Get all donations from the database
-        conn = sqlite3.connect(SQLITE_DB)
-        donations_df = pd.read_sql("SELECT * FROM donations ORDER BY donation_date DESC", conn)
-        conn.close()
+        version = get_donations_version()
+        filter_options = get_donation_filter_options(version)
         
-        if donations_df.empty:
+        if filter_options["first_date"] is None:
             st.info("No donations found in the database.")
         else:
-            # Convert donation_date to datetime for filtering
-            donations_df['donation_date'] = pd.to_datetime(donations_df['donation_date'])
+            first_date = datetime.fromisoformat(filter_options["first_date"]).date()
+            last_date = datetime.fromisoformat(filter_options["last_date"]).date()
             
             # Filters
             col1, col2, col3 = st.columns(3)
             with col1:
                 status_filter = st.selectbox(
                     "Filter by Status",
-                    ["All"] + donations_df['payment_status'].unique().tolist()
+                    ["All"] + filter_options["statuses"]
                 )
             with col2:
                 institution_filter = st.selectbox(
                     "Filter by Institution",
-                    ["All"] + donations_df['institution'].unique().tolist()
+                    ["All"] + filter_options["institutions"]
                 )
             with col3:
                 date_range = st.date_input(
                     "Filter by Date Range",
-                    value=[donations_df['donation_date'].min(), donations_df['donation_date'].max()],
-                    min_value=donations_df['donation_date'].min(),
-                    max_value=donations_df['donation_date'].max()
+                    value=[first_date, last_date],
+                    min_value=first_date,
+                    max_value=last_date
                 )
             
-            # Apply filters
-            filtered_df = donations_df.copy()
-            if status_filter != "All":
-                filtered_df = filtered_df[filtered_df['payment_status'] == status_filter]
-            if institution_filter != "All":
-                filtered_df = filtered_df[filtered_df['institution'] == institution_filter]
-            if len(date_range) == 2:
-                filtered_df = filtered_df[
-                    (filtered_df['donation_date'].dt.date >= date_range[0]) & 
-                    (filtered_df['donation_date'].dt.date <= date_range[1])
-                ]
+            start_date, end_date = date_range if len(date_range) == 2 else (None, None)
             
-            # Display metrics
+            # Display metrics, aggregated in SQL over the same filters
+            summary = get_filtered_donation_summary(status_filter, institution_filter, start_date, end_date, version)
             st.subheader("Summary Metrics")
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Total Donations", f"${filtered_df['amount'].sum():,.2f}")
+                st.metric("Total Donations", f"${summary['total_amount']:,.2f}")
             with col2:
-                st.metric("Number of Donations", len(filtered_df))
+                st.metric("Number of Donations", summary['donation_count'])
             with col3:
-                st.metric("Total Trees Donated", filtered_df['tree_count'].sum())
+                st.metric("Total Trees Donated", summary['total_trees'])
             with col4:
-                completed = len(filtered_df[filtered_df['payment_status'] == 'completed'])
-                st.metric("Completed Donations", f"{completed} ({completed/len(filtered_df)*100:.1f}%)")
+                completed = summary['completed']
+                completed_pct = completed / summary['donation_count'] * 100 if summary['donation_count'] else 0
+                st.metric("Completed Donations", f"{completed} ({completed_pct:.1f}%)")
             
-            # Display detailed table
+            # Display detailed table, one page of rows at a time
             st.subheader("Donation Details")
-            
-            # Select columns to display
-            display_cols = [
-                'donation_id', 'donor_name', 'donor_email', 'institution', 
-                'amount', 'tree_count', 'donation_date', 'payment_status'
-            ]
-            display_df = filtered_df[display_cols].rename(columns={
-                'donation_id': 'ID',
-                'donor_name': 'Donor Name',
-                'donor_email': 'Email',
-                'institution': 'Institution',
-                'amount': 'Amount',
-                'tree_count': 'Trees',
-                'donation_date': 'Date',
-                'payment_status': 'Status'
-            })
-            
-            # Format columns
-            display_df['Amount'] = display_df['Amount'].apply(lambda x: f"${x:,.2f}")
-            display_df['Date'] = display_df['Date'].dt.strftime('%Y-%m-%d %H:%M')
+            page_count = max(1, -(-summary['donation_count'] // ADMIN_PAGE_SIZE))
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+            st.caption(f"Page {page} of {page_count}")
+            filtered_df = load_filtered_donations(status_filter, institution_filter, start_date, end_date, page, version)
+            display_df = load_donation_display(status_filter, institution_filter, start_date, end_date, page, version)
             
             # Show the dataframe with expandable details
-            st.dataframe(display_df)
+            show_table(display_df, key="donations_grid")
             
-            # Allow admin to view details of each donation
-            selected_donation_id = st.selectbox(
-                "View details for a specific donation",
-                ["-- Select a donation --"] + filtered_df['donation_id'].tolist()
-            )
+            # Allow admin to view details of a donation: look one up by ID, or pick from the most recent on this page
+            lookup_id = st.text_input("Enter donation ID to view details").strip()
+            if lookup_id:
+                selected_donation_id = lookup_id
+            else:
+                selected_donation_id = st.selectbox(
+                    "Or pick one of the most recent donations",
+                    select_options(
+                        "donation_options",
+                        "-- Select a donation --",
+                        filtered_df['donation_id'].head(RECENT_DONATION_CHOICES),
+                        (version, status_filter, institution_filter, start_date, end_date, page)
+                    )
+                )
             
             if selected_donation_id != "-- Select a donation --":
                 donation_details = get_donation_by_id(selected_donation_id)
-                if donation_details:
+                if not donation_details:
+                    st.warning(f"No donation found with ID {selected_donation_id}")
+                else:
                     st.subheader("Donation Details")
                     col1, col2 = st.columns(2)
                     
@@ -831,28 +1412,20 @@ def admin_dashboard():
                         st.write(f"**Status:** {donation_details['payment_status'].title()}")
                     
                     # Show assigned trees if payment is completed
-                    if donation_details['payment_status'] == 'completed' and donation_details.get('trees'):
+                    if donation_details['payment_status'] == 'completed' and not donation_details['trees'].empty:
                         st.subheader("Assigned Trees")
-                        trees_df = pd.DataFrame(donation_details['trees'])
+                        trees_df = donation_details['trees']
                         
                         # Select columns to display
-                        tree_display_cols = ['tree_id', 'local_name', 'scientific_name', 'date_planted', 'status', 'co2_kg']
-                        tree_display_df = trees_df[tree_display_cols].rename(columns={
-                            'tree_id': 'Tree ID',
-                            'local_name': 'Local Name',
-                            'scientific_name': 'Scientific Name',
-                            'date_planted': 'Date Planted',
-                            'status': 'Status',
-                            'co2_kg': 'CO₂ (kg)'
-                        })
+                        tree_display_df = trees_df[list(TREE_RENAME)].rename(columns=TREE_RENAME)
                         
-                        st.dataframe(tree_display_df)
+                        show_table(tree_display_df, key="donation_trees_grid")
                     
                     # Admin actions
                     st.subheader("Admin Actions")
                     if donation_details['payment_status'] != 'completed':
                         if st.button("Mark as Completed", key=f"complete_{selected_donation_id}"):
-                            if update_payment_status(selected_donation_id, "completed"):
+                            if update_payment_status(selected_donation_id, "completed", donation=donation_details):
                                 st.success("Donation marked as completed!")
                                 st.rerun()
                             else:
@@ -860,63 +1433,60 @@ def admin_dashboard():
                     
                     # Download certificate if available
                     if donation_details.get('certificate_path'):
-                        with open(donation_details['certificate_path'], "rb") as file:
-                            st.download_button(
-                                label="Download Certificate",
-                                data=file,
-                                file_name=f"Certificate_{selected_donation_id}.png",
-                                mime="image/png"
-                            )
+                        st.download_button(
+                            label="Download Certificate",
+                            data=get_certificate_bytes(donation_details['certificate_path']),
+                            file_name=f"Certificate_{selected_donation_id}.png",
+                            mime="image/png"
+                        )
     
     with tab2:
         # Institution Management
         st.header("Institution Management")
         
         # Get all institutions
-        conn = sqlite3.connect(SQLITE_DB)
-        institutions_df = pd.read_sql("""
-            SELECT 
-                i.institution,
-                i.qualified,
-                i.qualification_reason,
-                i.qualification_date,
-                COUNT(d.donation_id) as donation_count,
-                SUM(d.amount) as total_donations,
-                SUM(d.tree_count) as total_trees_donated
-            FROM institution_qualification i
-            LEFT JOIN donations d ON i.institution = d.institution
-            GROUP BY i.institution
-            ORDER BY i.institution
-        """, conn)
-        conn.close()
+        institutions_df, institution_totals = load_institution_overview(get_donations_version())
         
         # Display current institutions
         st.subheader("Current Institutions")
         if institutions_df.empty:
             st.info("No institutions found in the database.")
+            if st.button("Qualify All Institutions With Trees"):
+                try:
+                    with db_writer() as conn:
+                        seed_default_qualifications(conn)
+                    bump_donations_version()
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error qualifying institutions: {str(e)}")
         else:
             # Display metrics
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Institutions", len(institutions_df))
+                st.metric("Total Institutions", int(institution_totals['institution_total']))
             with col2:
-                qualified = institutions_df['qualified'].sum()
-                st.metric("Qualified Institutions", f"{qualified} ({qualified/len(institutions_df)*100:.1f}%)")
+                qualified = int(institution_totals['qualified_total'])
+                st.metric("Qualified Institutions", f"{qualified} ({qualified/institution_totals['institution_total']*100:.1f}%)")
             with col3:
-                st.metric("Total Donations Received", f"${institutions_df['total_donations'].sum():,.2f}")
+                st.metric("Total Donations Received", f"${institution_totals['donations_total']:,.2f}")
             
             # Display institution table
-            st.dataframe(institutions_df)
+            show_table(institutions_df, key="institutions_grid", hide_index=True)
             
             # Institution management
             st.subheader("Manage Institutions")
             selected_institution = st.selectbox(
                 "Select an institution to manage",
-                ["-- Select an institution --"] + institutions_df['institution'].tolist()
+                select_options(
+                    "inst_options",
+                    "-- Select an institution --",
+                    institutions_df['institution'],
+                    get_donations_version()
+                )
             )
             
             if selected_institution != "-- Select an institution --":
-                institution_data = institutions_df[institutions_df['institution'] == selected_institution].iloc[0]
+                institution_data = institutions_df.loc[selected_institution]
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -935,87 +1505,53 @@ def admin_dashboard():
                 new_reason = st.text_area("Qualification Reason", value=institution_data['qualification_reason'])
                 
                 if st.button("Update Institution Status"):
-                    conn = sqlite3.connect(SQLITE_DB)
                     try:
-                        c = conn.cursor()
-                        c.execute(
-                            "UPDATE institution_qualification SET qualified = ?, qualification_reason = ?, qualification_date = ? WHERE institution = ?",
-                            (int(new_status), new_reason, datetime.now().isoformat(), selected_institution)
-                        )
-                        conn.commit()
+                        # The inner `with conn:` commits on success and rolls back on error
+                        with db_writer() as conn, conn:
+                            conn.execute(
+                                "UPDATE institution_qualification SET qualified = ?, qualification_reason = ?, qualification_date = ? WHERE institution = ?",
+                                (int(new_status), new_reason, datetime.now().isoformat(), selected_institution)
+                            )
+                        bump_donations_version()
                         st.success("Institution status updated!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error updating institution: {str(e)}")
-                    finally:
-                        conn.close()
     
     with tab3:
         # System Reports
         st.header("System Reports")
         
         # Get all data for reports
-        conn = sqlite3.connect(SQLITE_DB)
+        donation_trends, institution_performance = load_donation_reports(get_donations_version())
         
         # Donation trends over time
         st.subheader("Donation Trends")
-        donation_trends = pd.read_sql("""
-            SELECT 
-                date(donation_date) as day,
-                COUNT(*) as donation_count,
-                SUM(amount) as total_amount,
-                SUM(tree_count) as total_trees
-            FROM donations
-            WHERE payment_status = 'completed'
-            GROUP BY date(donation_date)
-            ORDER BY day
-        """, conn)
         
         if not donation_trends.empty:
-            # Display as tables instead of charts
-            st.write("Daily Donation Counts:")
-            st.dataframe(donation_trends[['day', 'donation_count']].rename(columns={
-                'day': 'Date',
-                'donation_count': 'Donations'
-            }))
-            
-            st.write("Daily Donation Amounts:")
-            st.dataframe(donation_trends[['day', 'total_amount']].rename(columns={
-                'day': 'Date',
-                'total_amount': 'Amount ($)'
-            }))
-            
-            st.write("Daily Trees Donated:")
-            st.dataframe(donation_trends[['day', 'total_trees']].rename(columns={
-                'day': 'Date',
-                'total_trees': 'Trees'
-            }))
+            # Daily donations, amounts and trees
+            show_table(donation_trends.rename(columns=TRENDS_RENAME), key="donation_trends_grid")
         
         # Institution performance
         st.subheader("Institution Performance")
-        institution_performance = pd.read_sql("""
-            SELECT 
-                institution,
-                COUNT(*) as donation_count,
-                SUM(amount) as total_amount,
-                SUM(tree_count) as total_trees,
-                AVG(amount) as avg_donation
-            FROM donations
-            WHERE payment_status = 'completed'
-            GROUP BY institution
-            ORDER BY total_amount DESC
-        """, conn)
         
         if not institution_performance.empty:
-            st.dataframe(institution_performance.rename(columns={
-                'institution': 'Institution',
-                'donation_count': 'Donations',
-                'total_amount': 'Total Amount ($)',
-                'total_trees': 'Total Trees',
-                'avg_donation': 'Average Donation ($)'
-            }))
+            st.dataframe(institution_performance.rename(columns=INSTITUTION_PERFORMANCE_RENAME))
         
-        conn.close()
+        # Duplicate tree assignments from older versions block the unique index until removed here
+        with db_conn() as conn:
+            duplicates = 0 if has_donated_trees_unique_index(conn) else count_duplicate_donated_trees(conn)
+        if duplicates:
+            st.subheader("Data Maintenance")
+            st.warning(f"{duplicates} donated-tree records repeat a tree already assigned to the same donation.")
+            if st.button("Remove Duplicate Tree Assignments"):
+                try:
+                    with db_writer() as conn:
+                        removed = remove_duplicate_donated_trees(conn)
+                    bump_donations_version()
+                    st.success(f"Removed {removed} duplicate records.")
+                except Exception as e:
+                    st.error(f"Error removing duplicates: {str(e)}")
 
 def main():
     """Main application function with navigation"""
@@ -1028,12 +1564,8 @@ def main():
         admin_dashboard()
 
 # Initialize session state variables
-if 'show_payment' not in st.session_state:
-    st.session_state.show_payment = False
-if 'current_donation_id' not in st.session_state:
-    st.session_state.current_donation_id = None
-if 'current_donation_amount' not in st.session_state:
-    st.session_state.current_donation_amount = 0
+for key, default in (("show_payment", False), ("current_donation", None)):
+    st.session_state.setdefault(key, default)
 
 if __name__ == "__main__":
     main()
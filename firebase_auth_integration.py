@@ -3,7 +3,8 @@ import firebase_admin
 from firebase_admin import credentials, auth, firestore
 from firebase_admin.exceptions import FirebaseError
 from firebase_admin import exceptions
-import uuid
+from google.cloud.firestore_v1.base_query import FieldFilter
+import secrets
 import datetime
 import re
 import json
@@ -11,7 +12,10 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pathlib import Path
+from string import Template
 import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,22 +26,26 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 BASE_DIR = Path(__file__).parent if "__file__" in locals() else Path.cwd()
+# Firestore commits at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+# Characters dropped from an institution name before taking its tracking-number prefix
+NON_LETTER_RE = re.compile(r'[^a-zA-Z]')
 
 # Email Templates
 EMAIL_TEMPLATES = {
     "approval": {
         "subject": "CarbonTally - Your Account Has Been Approved",
-        "body": """
+        "body": Template("""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 5px;">
                 <div style="text-align: center; margin-bottom: 20px;">
                     <h2 style="color: #2e8b57;">🌱 CarbonTally</h2>
                 </div>
-                <p>Dear {fullName},</p>
+                <p>Dear ${fullName},</p>
                 <p>Congratulations! Your CarbonTally account has been approved.</p>
-                <p>You can now log in using your email and password at <a href="{app_url}" style="color: #2e8b57;">CarbonTally</a>.</p>
-                <p><strong>Your Tree Tracking Number:</strong> {treeTrackingNumber}</p>
+                <p>You can now log in using your email and password at <a href="${app_url}" style="color: #2e8b57;">CarbonTally</a>.</p>
+                <p><strong>Your Tree Tracking Number:</strong> ${treeTrackingNumber}</p>
                 <p>This unique tracking number will help you monitor and track all trees you plant through our platform.</p>
                 <p>Thank you for joining our mission to combat climate change through tree planting initiatives!</p>
                 <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #e0e0e0; text-align: center; font-size: 0.8em; color: #666;">
@@ -47,18 +55,18 @@ EMAIL_TEMPLATES = {
             </div>
         </body>
         </html>
-        """
+        """)
     },
     "rejection": {
         "subject": "CarbonTally - Account Application Status",
-        "body": """
+        "body": Template("""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 5px;">
                 <div style="text-align: center; margin-bottom: 20px;">
                     <h2 style="color: #2e8b57;">🌱 CarbonTally</h2>
                 </div>
-                <p>Dear {fullName},</p>
+                <p>Dear ${fullName},</p>
                 <p>Thank you for your interest in CarbonTally.</p>
                 <p>We regret to inform you that your account application has not been approved at this time.</p>
                 <p>This could be due to various reasons, such as incomplete information or not meeting our current criteria.</p>
@@ -70,11 +78,11 @@ EMAIL_TEMPLATES = {
             </div>
         </body>
         </html>
-        """
+        """)
     },
     "password_reset": {
         "subject": "CarbonTally - Password Reset Link",
-        "body": """
+        "body": Template("""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 5px;">
@@ -85,7 +93,7 @@ EMAIL_TEMPLATES = {
                 <p>We received a request to reset your password for your CarbonTally account.</p>
                 <p>To reset your password, please click on the link below:</p>
                 <p style="text-align: center;">
-                    <a href="{reset_link}" style="display: inline-block; padding: 10px 20px; background-color: #2e8b57; color: white; text-decoration: none; border-radius: 5px;">Reset Password</a>
+                    <a href="${reset_link}" style="display: inline-block; padding: 10px 20px; background-color: #2e8b57; color: white; text-decoration: none; border-radius: 5px;">Reset Password</a>
                 </p>
                 <p>This link will expire in 24 hours.</p>
                 <p>If you did not request a password reset, please ignore this email or contact us if you have concerns.</p>
@@ -96,48 +104,50 @@ EMAIL_TEMPLATES = {
             </div>
         </body>
         </html>
-        """
+        """)
     }
 }
 
+@st.cache_resource(show_spinner=False)
+def get_firestore_client():
+    """
+    Build the Firebase app and Firestore client once per process and share them across reruns
+    Raises on missing or invalid credentials
+    """
+    if not firebase_admin._apps:
+        try:
+            # Try to load Firebase config from Streamlit secrets
+            firebase_config = {
+                "type": st.secrets["FIREBASE"]["TYPE"],
+                "project_id": st.secrets["FIREBASE"]["PROJECT_ID"],
+                "private_key_id": st.secrets["FIREBASE"]["PRIVATE_KEY_ID"],
+                "private_key": st.secrets["FIREBASE"]["PRIVATE_KEY"].replace('\\n', '\n'),
+                "client_email": st.secrets["FIREBASE"]["CLIENT_EMAIL"],
+                "client_id": st.secrets["FIREBASE"]["CLIENT_ID"],
+                "auth_uri": st.secrets["FIREBASE"]["AUTH_URI"],
+                "token_uri": st.secrets["FIREBASE"]["TOKEN_URI"],
+                "auth_provider_x509_cert_url": st.secrets["FIREBASE"]["AUTH_PROVIDER_X509_CERT_URL"],
+                "client_x509_cert_url": st.secrets["FIREBASE"]["CLIENT_X509_CERT_URL"],
+                "universe_domain": st.secrets["FIREBASE"]["UNIVERSE_DOMAIN"]
+            }
+        except KeyError:
+            # Fallback to local file if Streamlit secrets are not available
+            st.warning("Firebase secrets not found. Attempting to load credentials from firebase_credentials.json.")
+            cred_path = BASE_DIR / "firebase_credentials.json"
+            with open(cred_path, 'r') as f:
+                firebase_config = json.load(f)
+
+        # Initialize Firebase app
+        cred = credentials.Certificate(firebase_config)
+        firebase_admin.initialize_app(cred)
+
+    # Initialize Firestore
+    return firestore.client()
+
 def initialize_firebase():
     """Initialize Firebase Admin SDK if not already initialized"""
     try:
-        if not firebase_admin._apps:
-            try:
-                # Try to load Firebase config from Streamlit secrets
-                firebase_config = {
-                    "type": st.secrets["FIREBASE"]["TYPE"],
-                    "project_id": st.secrets["FIREBASE"]["PROJECT_ID"],
-                    "private_key_id": st.secrets["FIREBASE"]["PRIVATE_KEY_ID"],
-                    "private_key": st.secrets["FIREBASE"]["PRIVATE_KEY"].replace('\\n', '\n'),
-                    "client_email": st.secrets["FIREBASE"]["CLIENT_EMAIL"],
-                    "client_id": st.secrets["FIREBASE"]["CLIENT_ID"],
-                    "auth_uri": st.secrets["FIREBASE"]["AUTH_URI"],
-                    "token_uri": st.secrets["FIREBASE"]["TOKEN_URI"],
-                    "auth_provider_x509_cert_url": st.secrets["FIREBASE"]["AUTH_PROVIDER_X509_CERT_URL"],
-                    "client_x509_cert_url": st.secrets["FIREBASE"]["CLIENT_X509_CERT_URL"],
-                    "universe_domain": st.secrets["FIREBASE"]["UNIVERSE_DOMAIN"]
-                }
-            except KeyError:
-                # Fallback to local file if Streamlit secrets are not available
-                st.warning("Firebase secrets not found. Attempting to load credentials from firebase_credentials.json.")
-                cred_path = BASE_DIR / "firebase_credentials.json"
-                with open(cred_path, 'r') as f:
-                    firebase_config = json.load(f)
-
-            # Initialize Firebase app
-            cred = credentials.Certificate(firebase_config)
-            firebase_admin.initialize_app(cred)
-
-        # Initialize Firestore
-        db = firestore.client()
-
-        # Cache in session state
-        if 'firebase_db' not in st.session_state:
-            st.session_state.firebase_db = db
-
-        return db
+        return get_firestore_client()
 
     except Exception as e:
         st.error(f"Firebase initialization failed: {str(e)}")
@@ -145,7 +155,67 @@ def initialize_firebase():
         return None
 
 # Email Utility Functions
-def send_email(recipient_email, subject, html_content):
+def get_smtp_settings():
+    """
+    Read SMTP settings from secrets.toml
+    
+    Returns:
+        dict: server, port, username, password and sender address
+    """
+    smtp_username = st.secrets.get("SMTP_USERNAME", "")
+    return {
+        "server": st.secrets.get("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(st.secrets.get("SMTP_PORT", 587)),
+        "username": smtp_username,
+        "password": st.secrets.get("SMTP_PASSWORD", ""),
+        "sender": st.secrets.get("SMTP_SENDER", smtp_username)
+    }
+
+def open_smtp_connection(settings):
+    """
+    Open an SMTP connection, upgrade it to TLS and log in
+    
+    Args:
+        settings (dict): SMTP settings from get_smtp_settings
+        
+    Returns:
+        smtplib.SMTP: Logged-in SMTP connection
+    """
+    server = smtplib.SMTP(settings["server"], settings["port"])
+    try:
+        server.starttls()
+        server.login(settings["username"], settings["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+@contextmanager
+def smtp_session():
+    """
+    Keep one logged-in SMTP connection open for a batch of emails
+    
+    Yields:
+        smtplib.SMTP or None: Connection to pass to send_email, or None if it could not be opened
+        (send_email then falls back to its own connection)
+    """
+    settings = get_smtp_settings()
+    server = None
+    if settings["username"] and settings["password"]:
+        try:
+            server = open_smtp_connection(settings)
+        except Exception as e:
+            logger.error(f"Failed to open SMTP session: {str(e)}")
+    try:
+        yield server
+    finally:
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+def send_email(recipient_email, subject, html_content, server=None):
     """
     Send an email using SMTP settings from secrets.toml
     
@@ -153,37 +223,42 @@ def send_email(recipient_email, subject, html_content):
         recipient_email (str): Email address of the recipient
         subject (str): Email subject
         html_content (str): HTML content of the email
+        server (smtplib.SMTP, optional): Open connection from smtp_session to reuse
         
     Returns:
         bool: True if email was sent successfully, False otherwise
     """
     try:
         # Get SMTP settings from secrets.toml
-        smtp_server = st.secrets.get("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(st.secrets.get("SMTP_PORT", 587))
-        smtp_username = st.secrets.get("SMTP_USERNAME", "")
-        smtp_password = st.secrets.get("SMTP_PASSWORD", "")
-        sender_email = st.secrets.get("SMTP_SENDER", smtp_username)
+        settings = get_smtp_settings()
         
-        if not smtp_username or not smtp_password:
+        if not settings["username"] or not settings["password"]:
             logger.warning("SMTP credentials not found in secrets.toml. Email not sent.")
             return False
             
         # Create message
         message = MIMEMultipart("alternative")
         message["Subject"] = subject
-        message["From"] = sender_email
+        message["From"] = settings["sender"]
         message["To"] = recipient_email
         
         # Attach HTML content
         html_part = MIMEText(html_content, "html")
         message.attach(html_part)
         
+        # Reuse the session's connection while it is still alive
+        if server is not None:
+            try:
+                server.noop()
+                server.sendmail(settings["sender"], recipient_email, message.as_string())
+                logger.info(f"Email sent successfully to {recipient_email}")
+                return True
+            except smtplib.SMTPServerDisconnected:
+                logger.warning("SMTP session dropped; reconnecting for this email")
+        
         # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(sender_email, recipient_email, message.as_string())
+        with open_smtp_connection(settings) as server:
+            server.sendmail(settings["sender"], recipient_email, message.as_string())
             
         logger.info(f"Email sent successfully to {recipient_email}")
         return True
@@ -192,12 +267,13 @@ def send_email(recipient_email, subject, html_content):
         logger.error(f"Failed to send email: {str(e)}")
         return False
 
-def send_approval_email(user_data):
+def send_approval_email(user_data, server=None):
     """
     Send approval email to user
     
     Args:
         user_data (dict): User data including email, fullName, and treeTrackingNumber
+        server (smtplib.SMTP, optional): Open connection from smtp_session to reuse
         
     Returns:
         bool: True if email was sent successfully, False otherwise
@@ -213,25 +289,26 @@ def send_approval_email(user_data):
         # Format email template
         template = EMAIL_TEMPLATES["approval"]
         subject = template["subject"]
-        body = template["body"].format(
+        body = template["body"].substitute(
             fullName=full_name,
             treeTrackingNumber=tracking_number,
             app_url=app_url
         )
         
         # Send email
-        return send_email(recipient_email, subject, body)
+        return send_email(recipient_email, subject, body, server=server)
         
     except Exception as e:
         logger.error(f"Failed to send approval email: {str(e)}")
         return False
 
-def send_rejection_email(user_data):
+def send_rejection_email(user_data, server=None):
     """
     Send rejection email to user
     
     Args:
         user_data (dict): User data including email and fullName
+        server (smtplib.SMTP, optional): Open connection from smtp_session to reuse
         
     Returns:
         bool: True if email was sent successfully, False otherwise
@@ -243,10 +320,10 @@ def send_rejection_email(user_data):
         # Format email template
         template = EMAIL_TEMPLATES["rejection"]
         subject = template["subject"]
-        body = template["body"].format(fullName=full_name)
+        body = template["body"].substitute(fullName=full_name)
         
         # Send email
-        return send_email(recipient_email, subject, body)
+        return send_email(recipient_email, subject, body, server=server)
         
     except Exception as e:
         logger.error(f"Failed to send rejection email: {str(e)}")
@@ -273,7 +350,7 @@ def send_password_reset_email(email):
         # Format email template
         template = EMAIL_TEMPLATES["password_reset"]
         subject = template["subject"]
-        body = template["body"].format(reset_link=reset_link)
+        body = template["body"].substitute(reset_link=reset_link)
         
         # Send email
         return send_email(email, subject, body)
@@ -329,10 +406,22 @@ def firebase_login_ui():
                 st.warning("Please enter both email and password")
             else:
                 try:
-                    user_record = auth.get_user_by_email(email)
+                    db = get_firestore_client()
+                    
+                    # Fetch the auth record and the profile concurrently
+                    with ThreadPoolExecutor(max_workers=2) as pool:
+                        user_future = pool.submit(auth.get_user_by_email, email)
+                        profile_future = pool.submit(
+                            lambda: list(db.collection('users').where(filter=FieldFilter('email', '==', email)).limit(1).stream())
+                        )
+                        user_record = user_future.result()
+                        profile_docs = profile_future.result()
                     
-                    db = st.session_state.firebase_db
-                    user_doc = db.collection('users').document(user_record.uid).get()
+                    # Profiles are keyed by UID; fall back to a direct read if the email lookup found another document
+                    if profile_docs and profile_docs[0].id == user_record.uid:
+                        user_doc = profile_docs[0]
+                    else:
+                        user_doc = db.collection('users').document(user_record.uid).get()
                     
                     if user_doc.exists:
                         user_data = user_doc.to_dict()
@@ -448,7 +537,7 @@ def firebase_signup_ui():
                 )
                 
                 # Store additional user data in Firestore
-                db = st.session_state.firebase_db
+                db = get_firestore_client()
                 user_data = {
                     'fullName': fullname,
                     'email': email,
@@ -522,16 +611,40 @@ def generate_tree_tracking_number(role, institution=None):
     inst_prefix = ""
     if role == "institution" and institution:
         # Remove spaces, special chars, take first 3 letters
-        inst_prefix = re.sub(r'[^a-zA-Z]', '', institution)[:3].upper()
+        inst_prefix = NON_LETTER_RE.sub('', institution)[:3].upper()
     
-    # Generate random 6-digit number
-    random_digits = str(uuid.uuid4().int)[:6]
+    # Generate random 6-digit number, uniformly distributed and zero-padded
+    random_digits = f"{secrets.randbelow(1_000_000):06d}"
     
     # Combine to form tracking number
     tracking_number = f"{prefix}{inst_prefix}{random_digits}"
     
     return tracking_number
 
+def bulk_approve(db, users):
+    """
+    Approve several pending users with batched Firestore writes
+    
+    Args:
+        db: Firestore client
+        users (list): Pending user dicts, each including uid, role and institution
+        
+    Returns:
+        list: The approved users, each updated with its treeTrackingNumber
+    """
+    for start in range(0, len(users), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for user in users[start:start + FIRESTORE_BATCH_LIMIT]:
+            user['treeTrackingNumber'] = generate_tree_tracking_number(user.get('role'), user.get('institution'))
+            batch.update(db.collection('users').document(user.get('uid')), {
+                'status': 'approved',
+                'treeTrackingNumber': user['treeTrackingNumber'],
+                'approvedAt': firestore.SERVER_TIMESTAMP
+            })
+        batch.commit()
+    
+    return users
+
 def firebase_admin_approval_ui():
     """Display admin UI for approving new users and assigning tree tracking numbers"""
     if not st.session_state.get('authenticated'):
@@ -546,19 +659,16 @@ def firebase_admin_approval_ui():
     st.markdown("<h3 style='color: #1D7749;'>User Approval Dashboard</h3>", unsafe_allow_html=True)
     
     try:
-        db = st.session_state.firebase_db
+        db = get_firestore_client()
         
         # Get pending users
-        # For simplicity and to avoid complex Firestore indexing, we'll fetch all and filter in Python.
-        # In a very large scale app, you'd use Firestore queries with `where` clauses.
-        all_users_ref = db.collection('users').stream()
+        pending_users_ref = db.collection('users').where(filter=FieldFilter('status', '==', 'pending')).stream()
         pending_users = []
         
-        for user_doc in all_users_ref:
+        for user_doc in pending_users_ref:
             user_data = user_doc.to_dict()
             user_data['uid'] = user_doc.id # Add UID to the dictionary
-            if user_data.get('status') == 'pending':
-                pending_users.append(user_data)
+            pending_users.append(user_data)
         
         if not pending_users:
             st.info("No pending user applications")
@@ -566,6 +676,20 @@ def firebase_admin_approval_ui():
             
         st.write(f"Found {len(pending_users)} pending applications")
         
+        if st.button("Approve All", key="approve_all_pending", use_container_width=True):
+            approved_users = bulk_approve(db, pending_users)
+            
+            # Send approval emails over a single SMTP connection
+            with smtp_session() as server:
+                emails_sent = sum(send_approval_email(user, server=server) for user in approved_users)
+            
+            if emails_sent == len(approved_users):
+                st.success(f"Approved {len(approved_users)} users. Approval emails sent.")
+            else:
+                st.warning(f"Approved {len(approved_users)} users, but only {emails_sent} approval emails could be sent.")
+            
+            st.rerun()
+        
         for i, user in enumerate(pending_users):
             with st.expander(f"{user.get('fullName', 'N/A')} - {user.get('email', 'N/A')} ({user.get('role', 'N/A')})"):
                 st.write(f"**Full Name:** {user.get('fullName', 'N/A')}")
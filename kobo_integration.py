@@ -29,6 +29,10 @@ QR_CODE_DIR = DATA_DIR / "qr_codes"
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 QR_CODE_DIR.mkdir(exist_ok=True, parents=True)
 
+# Tree ID patterns
+NON_ALPHA_RE = re.compile(r'[^A-Z]')
+NUMERIC_SUFFIX_RE = re.compile(r'(\d+)$')
+
 def initialize_database():
     """Initialize the database with required tables, handling schema migrations for the 'trees' table."""
     conn = sqlite3.connect(SQLITE_DB)
@@ -425,7 +429,7 @@ def generate_tree_id(institution_name):
     if not institution_name:
         prefix = "TRE"
     else:
-        prefix = re.sub(r'[^A-Z]', '', institution_name.upper())[:3] or "TRE"
+        prefix = NON_ALPHA_RE.sub('', institution_name.upper())[:3] or "TRE"
 
     conn = sqlite3.connect(SQLITE_DB)
     try:
@@ -443,14 +447,11 @@ def generate_tree_id(institution_name):
         if not prefix_ids:
             return f"{prefix}001"
 
-        sequence_numbers = []
-        for id_str in prefix_ids:
-            match = re.search(r'\d+$', id_str)
-            if match:
-                try:
-                    sequence_numbers.append(int(match.group()))
-                except ValueError:
-                    continue
+        sequence_numbers = [
+            int(match.group(1))
+            for id_str in prefix_ids
+            if (match := NUMERIC_SUFFIX_RE.search(str(id_str)))
+        ]
 
         if not sequence_numbers:
             return f"{prefix}001"
@@ -482,13 +483,15 @@ def generate_qr_code(tree_id):
 
         img = qr.make_image(fill_color="#2e8b57", back_color="white")
 
-        QR_CODE_DIR.mkdir(exist_ok=True, parents=True)
-        file_path = QR_CODE_DIR / f"{tree_id}.png"
-        img.save(file_path)
-
         buffered = BytesIO()
         img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        png_bytes = buffered.getvalue()
+        img_str = base64.b64encode(png_bytes).decode()
+
+        # The monitoring views offer this file for download
+        QR_CODE_DIR.mkdir(exist_ok=True, parents=True)
+        file_path = QR_CODE_DIR / f"{tree_id}.png"
+        file_path.write_bytes(png_bytes)
 
         return img_str, str(file_path)
     except Exception as e:
@@ -504,7 +507,7 @@ def save_tree_submission(submission_data):
         return False, None, None
 
     tree_id = generate_tree_id(submission_data["institution"])
-    qr_img, qr_path = generate_qr_code(tree_id)
+    qr_img, _ = generate_qr_code(tree_id)
 
     if not qr_img:
         st.error(f"Failed to generate QR code for tree ID: {tree_id}")
@@ -551,7 +554,7 @@ def save_tree_submission(submission_data):
 
         conn.commit()
         st.success(f"Successfully saved tree {tree_id} to database.")
-        return True, tree_id, qr_path
+        return True, tree_id, qr_img
     except sqlite3.IntegrityError as e:
         st.error(f"Duplicate submission detected or integrity error: {str(e)}")
         conn.rollback()
@@ -563,19 +566,25 @@ def save_tree_submission(submission_data):
     finally:
         conn.close()
 
-def calculate_co2_sequestration(species, rcd=None, dbh=None):
+@st.cache_data(ttl=60, show_spinner=False)
+def get_wood_densities():
     """
-    Calculate estimated CO2 sequestration based on tree measurements.
+    Return a {scientific_name: wood_density} mapping for every species.
     """
     conn = sqlite3.connect(SQLITE_DB)
     try:
-        species_data = pd.read_sql(
-            "SELECT wood_density FROM species WHERE scientific_name = ?",
-            conn,
-            params=(species,)
-        )
+        return dict(conn.execute("SELECT scientific_name, wood_density FROM species").fetchall())
+    finally:
+        conn.close()
 
-        density = species_data["wood_density"].iloc[0] if not species_data.empty and species_data["wood_density"].iloc[0] is not None else 0.6
+def calculate_co2_sequestration(species, rcd=None, dbh=None):
+    """
+    Calculate estimated CO2 sequestration based on tree measurements.
+    """
+    try:
+        density = get_wood_densities().get(species)
+        if density is None:
+            density = 0.6
 
         agb = 0.0
         if dbh is not None and dbh > 0:
@@ -592,8 +601,6 @@ def calculate_co2_sequestration(species, rcd=None, dbh=None):
     except Exception as e:
         st.error(f"CO2 calculation error for species '{species}': {str(e)}")
         return 0.0
-    finally:
-        conn.close()
 
 def check_for_new_submissions(user_identifier, hours=24):
     """
@@ -676,12 +683,12 @@ def check_for_new_submissions(user_identifier, hours=24):
                         "submission_institution": submitted_institution
                     }
                 
-                success, tree_id, qr_path = save_tree_submission(mapped_data)
+                success, tree_id, qr_img = save_tree_submission(mapped_data)
                 
                 if success:
                     results.append({
                         "tree_id": tree_id,
-                        "qr_path": qr_path,
+                        "qr_code": qr_img,
                         "species": mapped_data["local_name"],
                         "institution": mapped_data["institution"],
                         "date": mapped_data["date_planted"],
@@ -733,18 +740,18 @@ def display_tree_results(results):
                     st.metric("CO₂ Sequestered", f"{result.get('co2', 0.0)} kg")
 
                 with col2:
-                    qr_path = result.get("qr_path")
-                    if qr_path and os.path.isfile(qr_path):
-                        st.image(qr_path, caption=f"QR for Tree {result['tree_id']}")
-                        with open(qr_path, "rb") as f:
-                            st.download_button(
-                                "Download QR Code",
-                                f.read(),
-                                file_name=f"tree_{result['tree_id']}_qr.png",
-                                mime="image/png"
-                            )
+                    qr_code = result.get("qr_code")
+                    if qr_code:
+                        qr_bytes = base64.b64decode(qr_code)
+                        st.image(qr_bytes, caption=f"QR for Tree {result['tree_id']}")
+                        st.download_button(
+                            "Download QR Code",
+                            qr_bytes,
+                            file_name=f"tree_{result['tree_id']}_qr.png",
+                            mime="image/png"
+                        )
                     else:
-                        st.warning(f"QR code file not found for Tree ID: {result.get('tree_id', 'N/A')}")
+                        st.warning(f"QR code not available for Tree ID: {result.get('tree_id', 'N/A')}")
 
                 st.markdown(f"""
                 **Share this tree:** [https://carbontally.app/tree?id={result.get('tree_id', '')}](https://carbontally.app/tree?id={result.get('tree_id', '')})
@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import json
 import time
+import operator
 import pandas as pd
 import sqlite3
 import qrcode
@@ -30,6 +31,19 @@ QR_CODE_DIR = DATA_DIR / "qr_codes"
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 QR_CODE_DIR.mkdir(exist_ok=True, parents=True)
 
+# Parameter order for the monitoring writes
+MONITORING_HISTORY_FIELDS = (
+    "tree_id", "monitor_date", "monitor_status", "monitor_stage", "rcd_cm", "dbh_cm",
+    "height_m", "co2_kg", "notes", "monitor_by", "kobo_submission_id"
+)
+TREE_UPDATE_FIELDS = (
+    "monitor_status", "monitor_stage", "rcd_cm", "dbh_cm", "height_m", "co2_kg",
+    "monitor_date", "tree_id"
+)
+get_monitoring_history_values = operator.itemgetter(*MONITORING_HISTORY_FIELDS)
+get_tree_update_values = operator.itemgetter(*TREE_UPDATE_FIELDS)
+
+@st.cache_resource(show_spinner=False)
 def initialize_database():
     """Initialize the database with required tables"""
     conn = sqlite3.connect(SQLITE_DB)
@@ -90,6 +104,7 @@ def initialize_database():
         conn.commit()
     except Exception as e:
         st.error(f"Database initialization error: {e}")
+        raise
     finally:
         conn.close()
 def validate_user_session():
@@ -233,28 +248,29 @@ def get_tree_details(tree_id):
         return None
         
     conn = sqlite3.connect(SQLITE_DB)
+    conn.row_factory = sqlite3.Row
     try:
-        tree_data = pd.read_sql(
+        tree_row = conn.execute(
             "SELECT * FROM trees WHERE tree_id = ?",
-            conn,
-            params=(tree_id,)
-        )
+            (tree_id,)
+        ).fetchone()
         
-        if tree_data.empty:
+        if tree_row is None:
             return None
             
-        monitoring_history = pd.read_sql(
+        monitoring_history = conn.execute(
             """
-            SELECT * FROM monitoring_history 
+            SELECT monitor_date, monitor_status, monitor_stage, rcd_cm, dbh_cm,
+                   height_m, co2_kg, monitor_by
+            FROM monitoring_history 
             WHERE tree_id = ? 
             ORDER BY monitor_date DESC
             """,
-            conn,
-            params=(tree_data.iloc[0]["tree_id"],)
-        )
+            (tree_row["tree_id"],)
+        ).fetchall()
         
-        result = tree_data.iloc[0].to_dict()
-        result["monitoring_history"] = monitoring_history.to_dict('records')
+        result = dict(tree_row)
+        result["monitoring_history"] = [dict(row) for row in monitoring_history]
         return result
     except Exception as e:
         st.error(f"Error getting tree details: {str(e)}")
@@ -492,19 +508,25 @@ def map_monitoring_submission_to_database(kobo_data):
         st.error(f"Error mapping monitoring data: {str(e)}")
         return None
 
-def calculate_co2_sequestration(species, rcd=None, dbh=None):
+@st.cache_data(ttl=60, show_spinner=False)
+def get_wood_densities():
     """
-    Calculate estimated CO2 sequestration based on tree measurements.
+    Return a {scientific_name: wood_density} mapping for every species.
     """
     conn = sqlite3.connect(SQLITE_DB)
     try:
-        species_data = pd.read_sql(
-            "SELECT wood_density FROM species WHERE scientific_name = ?",
-            conn,
-            params=(species,)
-        )
+        return dict(conn.execute("SELECT scientific_name, wood_density FROM species").fetchall())
+    finally:
+        conn.close()
 
-        density = species_data["wood_density"].iloc[0] if not species_data.empty and species_data["wood_density"].iloc[0] is not None else 0.6
+def calculate_co2_sequestration(species, rcd=None, dbh=None):
+    """
+    Calculate estimated CO2 sequestration based on tree measurements.
+    """
+    try:
+        density = get_wood_densities().get(species)
+        if density is None:
+            density = 0.6
 
         agb = 0.0
         if dbh is not None and dbh > 0:
@@ -521,8 +543,6 @@ def calculate_co2_sequestration(species, rcd=None, dbh=None):
     except Exception as e:
         st.error(f"CO2 calculation error for species '{species}': {str(e)}")
         return 0.0
-    finally:
-        conn.close()
 
 def save_monitoring_submission(monitoring_data):
     """
@@ -542,19 +562,7 @@ def save_monitoring_submission(monitoring_data):
                 tree_id, monitor_date, monitor_status, monitor_stage,
                 rcd_cm, dbh_cm, height_m, co2_kg, notes, monitor_by, kobo_submission_id
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            monitoring_data["tree_id"],
-            monitoring_data["monitor_date"],
-            monitoring_data["monitor_status"],
-            monitoring_data["monitor_stage"],
-            monitoring_data["rcd_cm"],
-            monitoring_data["dbh_cm"],
-            monitoring_data["height_m"],
-            monitoring_data["co2_kg"],
-            monitoring_data["notes"],
-            monitoring_data["monitor_by"],
-            monitoring_data["kobo_submission_id"]
-        ))
+        ''', get_monitoring_history_values(monitoring_data))
         
         # Update the tree record with latest monitoring data
         c.execute('''
@@ -567,16 +575,7 @@ def save_monitoring_submission(monitoring_data):
                 co2_kg = ?,
                 last_monitored = ?
             WHERE tree_id = ?
-        ''', (
-            monitoring_data["monitor_status"],
-            monitoring_data["monitor_stage"],
-            monitoring_data["rcd_cm"],
-            monitoring_data["dbh_cm"],
-            monitoring_data["height_m"],
-            monitoring_data["co2_kg"],
-            monitoring_data["monitor_date"],
-            monitoring_data["tree_id"]
-        ))
+        ''', get_tree_update_values(monitoring_data))
         
         # Mark submission as processed
         c.execute('''
@@ -603,6 +602,32 @@ def save_monitoring_submission(monitoring_data):
     finally:
         conn.close()
 
+def get_institution_matches(tree_ids, institution):
+    """
+    Look up which of the given trees belong to an institution in a single query
+    Returns a dict of tree_id -> bool; trees missing from the database are absent
+    """
+    if not tree_ids:
+        return {}
+        
+    conn = sqlite3.connect(SQLITE_DB)
+    try:
+        placeholders = ", ".join(["?"] * len(tree_ids))
+        rows = conn.execute(
+            f"""
+            SELECT tree_id, lower(trim(coalesce(institution, ''))) = lower(?)
+            FROM trees
+            WHERE tree_id IN ({placeholders})
+            """,
+            (institution, *tree_ids)
+        ).fetchall()
+        return {tree_id: bool(is_match) for tree_id, is_match in rows}
+    except Exception as e:
+        st.error(f"Error checking tree institutions: {str(e)}")
+        return {}
+    finally:
+        conn.close()
+
 def check_for_new_monitoring_submissions(hours=24):
     """
     Check for new monitoring submissions and process them
@@ -624,6 +649,10 @@ def check_for_new_monitoring_submissions(hours=24):
         st.error("Institution selection required to check submissions.")
         return []
         
+    # Resolve tree ownership for the whole batch
+    submitted_tree_ids = list({sub.get("tree_id", "").strip() for sub in submissions} - {""})
+    institution_matches = get_institution_matches(submitted_tree_ids, user_institution)
+        
     for sub in submissions:
         submission_kobo_id = sub.get("_id")
         if not submission_kobo_id:
@@ -641,15 +670,12 @@ def check_for_new_monitoring_submissions(hours=24):
             st.warning(f"Monitoring submission {submission_kobo_id} missing tree_id - skipping")
             continue
             
-        # Get tree details to check institution
-        tree_data = get_tree_details(tree_id)
-        if not tree_data:
+        # Check the tree exists and belongs to user's institution
+        if tree_id not in institution_matches:
             st.error(f"Tree with ID {tree_id} not found in database")
             continue
             
-        # Check if tree belongs to user's institution
-        tree_institution = tree_data.get("institution", "").strip()
-        is_institution_match = (tree_institution.lower() == user_institution.lower())
+        is_institution_match = institution_matches[tree_id]
         
         if is_institution_match:
             st.success(f"Processing monitoring submission for tree {tree_id} (matches your institution)")
@@ -671,11 +697,41 @@ def check_for_new_monitoring_submissions(hours=24):
                 
     return results
 
+def get_trees_by_ids(tree_ids):
+    """
+    Get the basic details of several trees in one query
+    Returns a dict of tree_id -> tree details
+    """
+    if not tree_ids:
+        return {}
+        
+    conn = sqlite3.connect(SQLITE_DB)
+    conn.row_factory = sqlite3.Row
+    try:
+        placeholders = ", ".join(["?"] * len(tree_ids))
+        rows = conn.execute(
+            f"""
+            SELECT tree_id, local_name, scientific_name, date_planted, student_name, institution
+            FROM trees
+            WHERE tree_id IN ({placeholders})
+            """,
+            tuple(tree_ids)
+        ).fetchall()
+        return {row["tree_id"]: dict(row) for row in rows}
+    except Exception as e:
+        st.error(f"Error getting tree details: {str(e)}")
+        return {}
+    finally:
+        conn.close()
+
 def display_monitoring_results(results):
     """Display processed monitoring results in Streamlit"""
     if results:
         st.success(f"🎉 Successfully processed {len(results)} new monitoring submission(s)! 🎉")
 
+        # Load the details of every monitored tree
+        trees_by_id = get_trees_by_ids(list({result.get("tree_id") for result in results} - {None}))
+
         for result in results:
             with st.expander(f"🌳 Tree {result.get('tree_id', 'N/A')} - {result.get('status', 'Unknown Status')}"):
                 col1, col2 = st.columns(2)
@@ -689,7 +745,7 @@ def display_monitoring_results(results):
                     st.metric("CO₂ Sequestered", f"{result.get('co2', 0.0)} kg")
                     
                     # Get tree details for QR code
-                    tree_data = get_tree_details(result.get("tree_id"))
+                    tree_data = trees_by_id.get(result.get("tree_id"))
                     if tree_data:
                         # Generate monitoring QR code
                         _, qr_path = generate_monitoring_qr_code(result.get("tree_id"), tree_data)
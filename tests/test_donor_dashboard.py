@@ -0,0 +1,310 @@
+import unittest
+import os
+import sys
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+from unittest.mock import patch
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import modules to test
+from donor_dashboard import (
+    update_payment_status,
+    create_donated_trees_unique_index,
+    remove_duplicate_donated_trees,
+    has_donated_trees_unique_index,
+    _donation_filter_clause
+)
+
+class TestUpdatePaymentStatus(unittest.TestCase):
+    """Test cases for completing donations"""
+
+    def setUp(self):
+        """Set up an in-memory database standing in for the pooled and writer connections"""
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("""CREATE TABLE donations (
+            donation_id TEXT PRIMARY KEY,
+            donor_name TEXT,
+            donor_email TEXT,
+            institution TEXT,
+            amount REAL,
+            tree_count INTEGER,
+            donation_date TEXT,
+            payment_status TEXT,
+            payment_id TEXT,
+            certificate_path TEXT
+        )""")
+        self.conn.execute("""CREATE TABLE trees (
+            tree_id TEXT PRIMARY KEY,
+            institution TEXT,
+            status TEXT,
+            co2_kg REAL
+        )""")
+        self.conn.execute("INSERT INTO trees VALUES ('T1', 'Test School', 'Alive', 10.0)")
+        self.conn.commit()
+        self.writer_held = False
+
+        @contextmanager
+        def fake_conn():
+            yield self.conn
+
+        @contextmanager
+        def fake_writer():
+            self.writer_held = True
+            try:
+                yield self.conn
+            finally:
+                self.writer_held = False
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+
+        patchers = [
+            patch('donor_dashboard.db_conn', fake_conn),
+            patch('donor_dashboard.db_writer', fake_writer),
+            patch('donor_dashboard.bump_donations_version'),
+            patch('donor_dashboard.generate_donation_certificate', return_value="certificates/D1.pdf"),
+            patch('donor_dashboard.assign_trees_to_donation', return_value=True),
+        ]
+        mocks = []
+        for patcher in patchers:
+            mocks.append(patcher.start())
+            self.addCleanup(patcher.stop)
+        self.mock_bump, self.mock_certificate, self.mock_assign = mocks[2:]
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.conn.close()
+
+    def add_donation(self, payment_status, certificate_path=None):
+        """Insert a test donation"""
+        self.conn.execute(
+            "INSERT INTO donations VALUES ('D1', 'Donor', 'donor@example.com', 'Test School', 50.0, 2, "
+            "'2024-01-15T10:00:00', ?, NULL, ?)",
+            (payment_status, certificate_path)
+        )
+        self.conn.commit()
+
+    def get_donation(self):
+        """Read the test donation back"""
+        return self.conn.execute(
+            "SELECT payment_status, certificate_path FROM donations WHERE donation_id = 'D1'"
+        ).fetchone()
+
+    def test_completion(self):
+        """Test that completing a pending donation issues a certificate and assigns trees in one write"""
+        self.add_donation("pending")
+
+        self.assertTrue(update_payment_status("D1", "completed", "PAY1"))
+
+        self.assertEqual(self.get_donation(), ("completed", "certificates/D1.pdf"))
+        self.mock_certificate.assert_called_once()
+        self.assertEqual(self.mock_certificate.call_args[0][1], 10.0)
+        self.mock_assign.assert_called_once_with(self.conn, "D1", "Test School", 2)
+        self.mock_bump.assert_called_once()
+
+    def test_certificate_rendered_outside_write_lock(self):
+        """Test that the certificate is rendered before the writer connection is taken"""
+        self.add_donation("pending")
+        held_while_rendering = []
+        self.mock_certificate.side_effect = lambda *args: held_while_rendering.append(self.writer_held) or "certificates/D1.pdf"
+
+        self.assertTrue(update_payment_status("D1", "completed", "PAY1"))
+
+        self.assertEqual(held_while_rendering, [False])
+
+    def test_status_update_without_completion(self):
+        """Test that other statuses only update the row"""
+        self.add_donation("pending")
+
+        self.assertTrue(update_payment_status("D1", "failed"))
+
+        self.assertEqual(self.get_donation(), ("failed", None))
+        self.mock_certificate.assert_not_called()
+        self.mock_assign.assert_not_called()
+
+    def test_replayed_completion(self):
+        """Test that a replayed completion is a no-op once the certificate exists"""
+        self.add_donation("completed", "certificates/D1.pdf")
+
+        self.assertTrue(update_payment_status("D1", "completed", "PAY1"))
+
+        self.assertEqual(self.get_donation(), ("completed", "certificates/D1.pdf"))
+        self.mock_certificate.assert_not_called()
+        self.mock_assign.assert_not_called()
+        self.mock_bump.assert_not_called()
+
+    def test_replay_retries_missing_certificate(self):
+        """Test that a replay after a failed certificate retries it without reassigning trees"""
+        self.add_donation("completed")
+
+        self.assertTrue(update_payment_status("D1", "completed"))
+
+        self.assertEqual(self.get_donation(), ("completed", "certificates/D1.pdf"))
+        self.mock_certificate.assert_called_once()
+        self.mock_assign.assert_not_called()
+
+    def test_stale_caller_copy(self):
+        """Test that a stale pending copy from the caller does not override the stored completion"""
+        self.add_donation("completed", "certificates/D1.pdf")
+        donation = {
+            "donation_id": "D1",
+            "institution": "Test School",
+            "tree_count": 2,
+            "payment_status": "pending",
+        }
+
+        self.assertTrue(update_payment_status("D1", "completed", donation=donation))
+
+        self.mock_certificate.assert_not_called()
+        self.mock_assign.assert_not_called()
+
+    @patch('donor_dashboard.st')
+    def test_failed_assignment_rolls_back(self, mock_st):
+        """Test that a failed tree assignment leaves the donation pending"""
+        self.add_donation("pending")
+        self.mock_assign.side_effect = sqlite3.OperationalError("database is locked")
+
+        self.assertFalse(update_payment_status("D1", "completed", "PAY1"))
+
+        self.assertEqual(self.get_donation(), ("pending", None))
+        mock_st.error.assert_called_once()
+        self.mock_bump.assert_not_called()
+
+class TestDonatedTreesUniqueIndex(unittest.TestCase):
+    """Test cases for the donated_trees unique index migration"""
+
+    def setUp(self):
+        """Set up a donated_trees table with the older index and a duplicate assignment"""
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("""CREATE TABLE donated_trees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            donation_id TEXT,
+            tree_id TEXT
+        )""")
+        self.conn.execute("CREATE INDEX idx_donated_trees_donation_tree ON donated_trees(donation_id, tree_id)")
+        self.conn.executemany("INSERT INTO donated_trees (donation_id, tree_id) VALUES (?, ?)", [
+            ("D1", "T1"),
+            ("D1", "T2"),
+            ("D1", "T1"),
+            ("D2", "T1"),
+        ])
+        self.conn.commit()
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.conn.close()
+
+    def get_rows(self):
+        """Remaining assignments, in insertion order"""
+        return self.conn.execute("SELECT id, donation_id, tree_id FROM donated_trees ORDER BY id").fetchall()
+
+    def test_index_refused_while_duplicates_exist(self):
+        """Test that startup never deletes rows to create the index"""
+        self.assertFalse(create_donated_trees_unique_index(self.conn))
+
+        self.assertEqual(len(self.get_rows()), 4)
+        self.assertFalse(has_donated_trees_unique_index(self.conn))
+
+    def test_duplicates_removed_once(self):
+        """Test that the cleanup keeps the first assignment, creates the index and then does nothing"""
+        self.assertEqual(remove_duplicate_donated_trees(self.conn), 1)
+
+        self.assertEqual(self.get_rows(), [(1, "D1", "T1"), (2, "D1", "T2"), (4, "D2", "T1")])
+        self.assertTrue(has_donated_trees_unique_index(self.conn))
+
+        # A second run finds the index and leaves the table alone
+        self.conn.execute("INSERT OR IGNORE INTO donated_trees (donation_id, tree_id) VALUES ('D1', 'T1')")
+        self.assertEqual(remove_duplicate_donated_trees(self.conn), 0)
+        self.assertEqual(len(self.get_rows()), 3)
+
+    def test_unique_index_rejects_duplicates(self):
+        """Test that the index replaces the older one and rejects a repeated assignment"""
+        remove_duplicate_donated_trees(self.conn)
+
+        indexes = {row[1] for row in self.conn.execute("PRAGMA index_list(donated_trees)")}
+        self.assertEqual(indexes, {"idx_donated_trees_unique"})
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("INSERT INTO donated_trees (donation_id, tree_id) VALUES ('D2', 'T1')")
+
+    def test_index_created_without_duplicates(self):
+        """Test that a clean table gets the index at startup"""
+        self.conn.execute("DELETE FROM donated_trees WHERE id = 3")
+
+        self.assertTrue(create_donated_trees_unique_index(self.conn))
+        self.assertTrue(create_donated_trees_unique_index(self.conn))
+
+        self.assertTrue(has_donated_trees_unique_index(self.conn))
+        self.assertEqual(len(self.get_rows()), 3)
+
+class TestDonationFilterClause(unittest.TestCase):
+    """Test cases for the admin donation filter clause"""
+
+    def setUp(self):
+        """Set up donations on either side of the date bounds"""
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("""CREATE TABLE donations (
+            donation_id TEXT PRIMARY KEY,
+            institution TEXT,
+            donation_date TEXT,
+            payment_status TEXT
+        )""")
+        self.conn.executemany("INSERT INTO donations VALUES (?, ?, ?, ?)", [
+            ("D0", "Test School", "2024-01-09T23:59:59.999999", "completed"),
+            ("D1", "Test School", "2024-01-10T00:00:00", "completed"),
+            ("D2", "Test School", "2024-01-20T23:59:59.999999", "completed"),
+            ("D3", "Test School", "2024-01-21T00:00:00", "completed"),
+            ("D4", "Other School", "2024-01-15T12:00:00", "pending"),
+        ])
+
+    def tearDown(self):
+        """Clean up test environment"""
+        self.conn.close()
+
+    def matching_ids(self, *filters):
+        """Donation ids matching the given filters"""
+        where, params = _donation_filter_clause(*filters)
+        rows = self.conn.execute(
+            f"SELECT donation_id FROM donations {where} ORDER BY donation_id", params
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def test_no_filters(self):
+        """Test that the default filters match every donation"""
+        where, params = _donation_filter_clause("All", "All", None, None)
+
+        self.assertEqual(where, "WHERE 1=1")
+        self.assertEqual(params, [])
+
+    def test_date_bounds(self):
+        """Test that both date bounds are inclusive of whole days"""
+        ids = self.matching_ids("All", "All", date(2024, 1, 10), date(2024, 1, 20))
+
+        self.assertEqual(ids, ["D1", "D2", "D4"])
+
+    def test_single_day(self):
+        """Test that equal start and end dates match that whole day"""
+        ids = self.matching_ids("All", "All", date(2024, 1, 21), date(2024, 1, 21))
+
+        self.assertEqual(ids, ["D3"])
+
+    def test_partial_date_range(self):
+        """Test that the date filter applies only when both dates are set"""
+        ids = self.matching_ids("All", "All", date(2024, 1, 10), None)
+
+        self.assertEqual(ids, ["D0", "D1", "D2", "D3", "D4"])
+
+    def test_combined_filters(self):
+        """Test that status, institution and dates combine"""
+        self.assertEqual(
+            self.matching_ids("completed", "Test School", date(2024, 1, 10), date(2024, 1, 20)),
+            ["D1", "D2"]
+        )
+        self.assertEqual(
+            self.matching_ids("pending", "Other School", None, None),
+            ["D4"]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
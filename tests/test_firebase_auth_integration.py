@@ -0,0 +1,99 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch, MagicMock
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import modules to test
+from firebase_auth_integration import (
+    FIRESTORE_BATCH_LIMIT,
+    bulk_approve,
+    generate_tree_tracking_number
+)
+
+class TestBulkApprove(unittest.TestCase):
+    """Test cases for batched user approval"""
+
+    def setUp(self):
+        """Set up a mock Firestore client that hands out a new batch per call"""
+        self.db = MagicMock()
+        self.batches = []
+
+        def new_batch():
+            batch = MagicMock()
+            self.batches.append(batch)
+            return batch
+
+        self.db.batch.side_effect = new_batch
+
+    def make_users(self, count):
+        """Pending institution users"""
+        return [
+            {"uid": f"user{i}", "role": "institution", "institution": "Acme School"}
+            for i in range(count)
+        ]
+
+    @patch('firebase_auth_integration.firestore')
+    def test_chunks_at_batch_limit(self, mock_firestore):
+        """Test that writes are split into batches of at most FIRESTORE_BATCH_LIMIT"""
+        users = self.make_users(2 * FIRESTORE_BATCH_LIMIT + 1)
+
+        approved = bulk_approve(self.db, users)
+
+        self.assertEqual(len(self.batches), 3)
+        self.assertEqual(
+            [batch.update.call_count for batch in self.batches],
+            [FIRESTORE_BATCH_LIMIT, FIRESTORE_BATCH_LIMIT, 1]
+        )
+        for batch in self.batches:
+            batch.commit.assert_called_once()
+        self.assertEqual(len(approved), len(users))
+
+    @patch('firebase_auth_integration.firestore')
+    def test_exact_batch_limit(self, mock_firestore):
+        """Test that a full batch does not leave an empty trailing batch"""
+        bulk_approve(self.db, self.make_users(FIRESTORE_BATCH_LIMIT))
+
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(self.batches[0].update.call_count, FIRESTORE_BATCH_LIMIT)
+
+    @patch('firebase_auth_integration.firestore')
+    def test_no_users(self, mock_firestore):
+        """Test that approving nobody writes nothing"""
+        self.assertEqual(bulk_approve(self.db, []), [])
+        self.db.batch.assert_not_called()
+
+    @patch('firebase_auth_integration.firestore')
+    def test_updates_carry_tracking_numbers(self, mock_firestore):
+        """Test that each user's update matches the tracking number it is given"""
+        users = self.make_users(3)
+
+        bulk_approve(self.db, users)
+
+        updates = self.batches[0].update.call_args_list
+        for user, update in zip(users, updates):
+            fields = update[0][1]
+            self.assertEqual(fields['status'], 'approved')
+            self.assertEqual(fields['treeTrackingNumber'], user['treeTrackingNumber'])
+            self.assertEqual(fields['approvedAt'], mock_firestore.SERVER_TIMESTAMP)
+            self.assertRegex(user['treeTrackingNumber'], r'^IACM\d{6}$')
+        self.db.collection.assert_called_with('users')
+        self.db.collection.return_value.document.assert_any_call('user0')
+
+class TestTreeTrackingNumber(unittest.TestCase):
+    """Test cases for tree tracking numbers"""
+
+    def test_format(self):
+        """Test tracking number format for individuals and institutions"""
+        self.assertRegex(generate_tree_tracking_number('individual'), r'^N\d{6}$')
+        self.assertRegex(generate_tree_tracking_number('institution', 'St. Mary'), r'^ISTM\d{6}$')
+
+    def test_digits_zero_padded(self):
+        """Test that small random draws are zero-padded to six digits"""
+        with patch('firebase_auth_integration.secrets.randbelow', return_value=42):
+            self.assertEqual(generate_tree_tracking_number('individual'), 'N000042')
+
+if __name__ == '__main__':
+    unittest.main()